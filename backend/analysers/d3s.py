@@ -1,5 +1,6 @@
+import re
 from lighthouse.analysis import FunctionCallAnalyser
-from lighthouse.misc import to_c
+from lighthouse.misc import to_c, LRU
 
 unpack = [
   ('i(%d)' % x, 'int%d_t*' % x) for x in (8, 16, 32, 64)
@@ -54,47 +55,79 @@ pack = [
 
 symbol_type = 'struct DSSymbolNode*'
 
+# interned, so comparing them with the (cached) spelling of a
+# type is usually just an identity check.
+unpack = [(spec, intern(t)) for spec, t in unpack]
+pack = [(spec, intern(t)) for spec, t in pack]
+symbol_type = intern(symbol_type)
+
+FORMAT_CACHE_SIZE = 2048
+
+class FormatMatcher(object):
+    """
+    Splits format strings into the types of the arguments they describe,
+    using one regex compiled from a spec table.  In order of precedence:
+    '|' is skipped; '-' (and, when unpacking, any character but a-z) is an
+    argument that is not checked (None); otherwise the first spec in the
+    table to match gives the argument's type.
+    
+    Decompositions are cached by format string, failures included.
+    """
+    SKIP, UNCHECKED, SPEC = 1, 2, 3
+    
+    def __init__(self, specs, unpack):
+        self.types = dict(specs)
+        unchecked = unpack and '[^a-z]' or '-'
+        alternatives = '|'.join([re.escape(spec) for spec, t in specs])
+        self.regex = re.compile(r'(\|)|(%s)|(%s)' % (unchecked, alternatives))
+        self.cache = LRU(FORMAT_CACHE_SIZE)
+    
+    def decompose(self, format):
+        """
+        Returns a tuple of types (or None for unchecked arguments), or
+        raises ValueError with the part of 'format' that is not understood.
+        """
+        r = self.cache.get(format)
+        if r is None:
+            r = self._decompose(format)
+            self.cache[format] = r
+        if isinstance(r, basestring):
+            raise ValueError, r
+        return r
+    
+    def _decompose(self, format):
+        out = []
+        pos, end = 0, len(format)
+        match = self.regex.match
+        
+        while pos < end:
+            m = match(format, pos)
+            if m is None:
+                return format[pos:]
+            pos = m.end()
+            if m.lastindex == self.UNCHECKED:
+                out.append(None)
+            elif m.lastindex == self.SPEC:
+                out.append(self.types[m.group()])
+        return tuple(out)
+
 
 class D3SAnalyser(FunctionCallAnalyser):
     def __init__(self):
         FunctionCallAnalyser.__init__(self)
+        self.matchers = {}
     
     def decompose_format_string(self, stmt, format, specs, unpack = True):
-        out = []
-        
-        lastlen = len(format)
-        
-        while True:
-            handled = False
-            
-            if format == '':
-                break
-                
-            if format.startswith('|'):
-                format = format[1:]
-                continue
-
-            if format[0] == '-':
-                format = format[1:]
-                out.append(None)
-                continue
-             
-            if unpack and format[0] == format[0].upper():
-                format = format[1:]
-                out.append(None)
-                continue
-            
-            for fmtspec, fmttype in specs:
-                if format.startswith(fmtspec):
-                    out.append(fmttype)
-                    format = format[len(fmtspec):]
-                    lastlen = len(format)
-                    handled = True
-                    break
-            if not handled:
-                self.error('Unknown format string ' + repr(format), location = {'call-site': stmt})
+        key = (id(specs), unpack)
+        entry = self.matchers.get(key)
+        if entry is None or entry[0] is not specs:
+            entry = self.matchers[key] = (specs, FormatMatcher(specs, unpack))
+        matcher = entry[1]
         
-        return out
+        try:
+            return list(matcher.decompose(format))
+        except ValueError, e:
+            self.error('Unknown format string ' + repr(e.args[0]), location = {'call-site': stmt})
     
     def pop_or_error(self, stmt, tt):
         if len(tt) == 0:
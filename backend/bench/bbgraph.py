@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - control flow graph layout benchmark.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Compares bbgraph's arrow layout (graph.rank_arrows) with the nested
+searches it replaced, on single functions from lighthouse.synth with
+more and more blocks.  The old layout is only timed up to --old-limit
+blocks, as it takes minutes beyond a few hundred; wherever both run,
+their results are checked to be identical.  The time to render the
+whole function (bbgraph.construct) is shown too.
+"""
+
+import os, os.path, sys, time, gc, tempfile, optparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+backend = os.path.join(here, '..')
+sys.path.insert(0, backend)
+sys.path.insert(0, os.path.join(backend, 'server'))
+sys.path.insert(0, os.path.join(backend, '..', 'server')) # utils, for bbgraph
+
+import lighthouse.input
+import lighthouse.synth as synth
+import codepresentation.bbgraph as bbgraph
+
+SIZES = (25, 50, 100, 200, 1000, 5000)
+SHAPES = ('mixed', 'switch')
+
+# --- the layout as it was.
+def old_rank_arrows(self):
+    def find(id):
+        for x in self.blocks:
+            if id == x.bb.id:
+                return x
+    
+    def indices(st, ed):
+        return self.blocks.index(st), self.blocks.index(ed)
+    
+    def block_span(st, ed):
+        sti, edi = indices(st, ed)
+        return abs(edi - sti)
+    
+    def arrows_in_block(b):
+        id = self.blocks.index(b)
+        out = set()
+        for a in self.arrows:
+            sti, edi = indices(find(a.start), find(a.end))
+            for x in range(sti, edi + 1):
+                if id == self.blocks[x].bb.id:
+                    out.add(a)
+        return out
+    
+    def max_rank_in_block(b):
+        depths = [a.depth for a in arrows_in_block(b)]
+        if depths:
+            return max(depths)
+        return 0
+    
+    def arrow_span(st, ed):
+        ranks = []
+        sti, edi = indices(st, ed)
+        for i in range(sti, edi + 1):
+            ranks.append(max_rank_in_block(self.blocks[i]))
+        if ranks:
+            return max(ranks) + 1
+        else:
+            return 1
+        
+    for a in self.arrows:
+        s, e = find(a.start), find(a.end)
+        a.depth = block_span(s, e)
+    for a in self.arrows:
+        s, e = find(a.start), find(a.end)
+        a.rank = arrow_span(s, e) + a.depth
+
+def best(repeat, fn, *args):
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        fn(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+def layout(g):
+    return [(a.depth, a.rank) for a in g.arrows]
+
+def function(blocks, shape, seed):
+    fd, fn = tempfile.mkstemp(suffix = '.lh')
+    os.close(fd)
+    try:
+        synth.generate(fn, functions = 1, blocks = blocks, shape = shape, seed = seed)
+        return lighthouse.input.parse(fn, cache = False).functions[0]
+    finally:
+        os.unlink(fn)
+
+def bench(shape, f, repeat, old_limit):
+    g = bbgraph.build(f)
+    new = best(repeat, g.rank_arrows)
+    expect = layout(g)
+    render = best(repeat, bbgraph.construct, f)
+    print '%-7s %6d %6d  %8.4f' % (shape, len(g.blocks), len(g.arrows), new),
+    if len(g.blocks) <= old_limit:
+        old = best(1, old_rank_arrows, g)
+        assert layout(g) == expect, 'layouts differ'
+        print '%9.4f %8.0fx' % (old, old / max(new, 1e-6)),
+    else:
+        print '%9s %9s' % ('-', '-'),
+    print '%9.4f' % render
+
+if __name__ == '__main__':
+    p = optparse.OptionParser(usage = '%prog [options] [blocks...]')
+    p.add_option('-r', '--repeat', type = 'int', default = 3,
+                 help = 'runs of the new layout (default %default)')
+    p.add_option('-l', '--old-limit', type = 'int', default = 100,
+                 help = 'most blocks to run the old layout on (default %default)')
+    p.add_option('--seed', type = 'int', default = 0)
+    opts, args = p.parse_args()
+
+    print '%-7s %6s %6s  %8s %9s %9s %9s' % ('shape', 'blocks', 'arrows', 'new', 'old', 'speedup', 'render')
+    for shape in SHAPES:
+        for blocks in [int(x) for x in args] or SIZES:
+            bench(shape, function(blocks, shape, opts.seed), opts.repeat, opts.old_limit)
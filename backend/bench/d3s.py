@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - D3S format string decomposition benchmark.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Times D3SAnalyser.decompose_format_string over a synthetic corpus of
+dsPack and dsUnpack format strings (a few hundred distinct literals,
+each used at many call sites), against the original character by
+character decomposition, and checks that both give the same answers.
+"""
+
+import os, os.path, sys, time, random, optparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+sys.path.insert(0, os.path.join(here, '..', 'analysers'))
+
+import lighthouse.diagnostics as diagnostics
+from lighthouse.analysis import StopAnalysis
+import d3s
+
+def reference(format, specs, unpack = True):
+    """
+    The original decomposition, returning the unparsed rest on failure.
+    """
+    out = []
+    while format:
+        if format.startswith('|'):
+            format = format[1:]
+            continue
+        if format[0] == '-':
+            format = format[1:]
+            out.append(None)
+            continue
+        if unpack and format[0] == format[0].upper():
+            format = format[1:]
+            out.append(None)
+            continue
+        for fmtspec, fmttype in specs:
+            if format.startswith(fmtspec):
+                out.append(fmttype)
+                format = format[len(fmtspec):]
+                break
+        else:
+            return format
+    return out
+
+def literal(rng, specs, unpack, length):
+    bits = []
+    for i in range(length):
+        r = rng.random()
+        if r < 0.05:
+            bits.append('|')
+        elif r < 0.1:
+            bits.append('-')
+        elif unpack and r < 0.2:
+            bits.append(rng.choice('ABCDEFGHJK'))
+        else:
+            bits.append(rng.choice(specs)[0])
+    if rng.random() < 0.02:
+        bits.append('?') # unknown
+    return ''.join(bits)
+
+def corpus(rng, distinct, sites, length):
+    kinds = [(d3s.pack, False), (d3s.unpack, True)]
+    literals = []
+    for i in range(distinct):
+        specs, unpack = rng.choice(kinds)
+        literals.append((literal(rng, specs, unpack, rng.randint(1, length)), specs, unpack))
+    return [rng.choice(literals) for i in range(sites)]
+
+class Stmt(object):
+    location = None
+
+def run(calls, fn):
+    start = time.time()
+    for format, specs, unpack in calls:
+        fn(format, specs, unpack)
+    return time.time() - start
+
+if __name__ == '__main__':
+    p = optparse.OptionParser(usage = '%prog [options]')
+    p.add_option('--distinct', type = 'int', default = 300,
+                 help = 'distinct format strings (default %default)')
+    p.add_option('--sites', type = 'int', default = 100000,
+                 help = 'call sites (default %default)')
+    p.add_option('--length', type = 'int', default = 24,
+                 help = 'maximum specifiers per format (default %default)')
+    p.add_option('--seed', type = 'int', default = 1)
+    opts, args = p.parse_args()
+
+    calls = corpus(random.Random(opts.seed), opts.distinct, opts.sites, opts.length)
+    analyser = d3s.D3SAnalyser()
+    analyser.sink = diagnostics.MemorySink()
+    stmt = Stmt()
+
+    def compiled(format, specs, unpack):
+        try:
+            return analyser.decompose_format_string(stmt, format, specs, unpack)
+        except StopAnalysis:
+            return analyser.sink.diagnostics.pop().message
+
+    # same answers (failures compared by message).
+    for (format, unpack), specs in dict([((f, u), s) for f, s, u in calls]).items():
+        want = reference(format, specs, unpack)
+        if isinstance(want, basestring):
+            want = 'Unknown format string ' + repr(want)
+        got = compiled(format, specs, unpack)
+        assert got == want, (format, got, want)
+
+    old = run(calls, reference)
+    new = run(calls, compiled)
+    print '%d call sites, %d distinct formats' % (opts.sites, opts.distinct)
+    print '  reference  %.3fs' % old
+    print '  compiled   %.3fs  (%.1fx)' % (new, old / new)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - XML tag dispatch benchmark.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Compares the module-level tag dispatch tables with the if-chains and
+per-call 'kinds' dicts they replaced, on the given .lh files (by
+default the samples in plugin/):
+
+ - 'tags': choosing a constructor for every element in each file;
+ - 'parse': parsing each file with the tables, then with the old
+   dispatchers patched back in.  Files that fail to parse (eg. written
+   by an older plugin) are skipped.
+"""
+
+import os, os.path, sys, time, glob, gc
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+
+from lighthouse.etree import etree
+from lighthouse.misc import descend_one, dump
+import lighthouse.input
+import lighthouse.expression as expression
+import lighthouse.statements as statements
+import lighthouse.constant as constant
+import lighthouse.types as types
+
+REPEAT = 5
+
+# --- the dispatchers as they were.
+def old_expression_from_xml(t):
+    E = expression
+    if t.tag in E.valid_lvalues:
+        return E.result_from_xml(t)
+    if t.tag in ('constant',):
+        return constant.convert(t)
+    if t.tag in E.binary_operators.keys():
+        return E.BinaryOp(E.binary_operators[t.tag])
+    if t.tag in E.unary_operators.keys():
+        return E.UnaryOp(E.unary_operators[t.tag])
+    if t.tag == 'addr-of':
+        return E.AddrOf(t)
+    if t.tag == 'void':
+        return E.Void()
+    if t.tag == 'function':
+        return expression.expression_from_xml(descend_one(t))
+    print 'warn: tag %s unhandled, returning dummy bound' % (t.tag)
+    dump(t)
+    return E.Bound()
+
+def old_statement_from_xml(t):
+    S = statements
+    kinds = {
+      'assign': S.Assignment,
+      'if': S.Cond,
+      'call': S.Call,
+      'switch': S.Switch,
+      'return': S.Ret,
+    }
+    ignore = set(['exception-dispatch'])
+    if t.tag in ignore:
+        return None
+    assert t.tag in kinds, 'unknown type ' + t.tag
+    return kinds[t.tag].from_xml(t)
+
+def old_convert(t):
+    kinds = {'string-literal': constant.ConstantString,
+             'integer-literal': constant.ConstantInteger,
+             'float-literal': constant.ConstantFloat}
+    assert t.tag == 'constant'
+    type, value = t.getchildren()
+    assert value.tag in kinds.keys()
+    return kinds[value.tag](type, value)
+
+def old_type_from_xml(t):
+    T = types
+    kinds = {
+      'addr-of': T.AddrOf,
+      'float': T.Float,
+      'integer': T.Integer,
+      'void': T.Void,
+      'function': T.Function,
+      'structure': T.AggregateRef,
+      'array': T.AggregateRef,
+      'enum': T.Enum,
+      'boolean': T.Boolean,
+      'union': T.AggregateRef,
+    }
+    assert t.tag in kinds, 'unknown type ' + t.tag
+    return kinds[t.tag].from_xml(t)
+
+OLD = [(expression, 'expression_from_xml', old_expression_from_xml),
+       (statements, 'statement_from_xml', old_statement_from_xml),
+       (constant, 'convert', old_convert),
+       (types, '_type_from_xml', old_type_from_xml)]
+
+def patched(fn, *args):
+    """
+    Calls fn(*args) with the old dispatchers in place.
+    """
+    saved = [(m, name, getattr(m, name)) for m, name, old in OLD]
+    for m, name, old in OLD:
+        setattr(m, name, old)
+    try:
+        return fn(*args)
+    finally:
+        for m, name, new in saved:
+            setattr(m, name, new)
+
+# --- choosing a constructor, by tag.
+def old_choice(tag):
+    E = expression
+    if tag in E.valid_lvalues:
+        return 1
+    if tag in ('constant',):
+        return 2
+    if tag in E.binary_operators.keys():
+        return 3
+    if tag in E.unary_operators.keys():
+        return 4
+    if tag in ('addr-of', 'void', 'function'):
+        return 5
+    return None
+
+def new_choice(tag):
+    return expression.expression_kinds.get(tag)
+
+def best(fn, *args):
+    times = []
+    for i in range(REPEAT):
+        gc.collect()
+        start = time.time()
+        fn(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+def choose_all(choose, tags):
+    for tag in tags:
+        choose(tag)
+
+def parse(fn):
+    lighthouse.input.parse(fn, cache = False)
+
+def quietly(fn, *args):
+    # the old schema makes the expression reader complain a lot.
+    old = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        return fn(*args)
+    finally:
+        sys.stdout = old
+
+def bench(fn):
+    print fn
+    tags = [e.tag for e in etree.parse(fn).getroot().iter()]
+    old, new = best(choose_all, old_choice, tags), best(choose_all, new_choice, tags)
+    print '  tags   %7d elements  old %.4fs  new %.4fs  (%.1fx)' % \
+        (len(tags), old, new, old / new)
+
+    try:
+        quietly(parse, fn)
+    except Exception, e:
+        print '  parse  skipped: %s: %s' % (e.__class__.__name__, e)
+        return
+    new = best(quietly, parse, fn)
+    old = best(quietly, patched, parse, fn)
+    print '  parse  old %.4fs  new %.4fs  (%.2fx)' % (old, new, old / new)
+
+if __name__ == '__main__':
+    files = sys.argv[1:] or sorted(glob.glob(os.path.normpath(os.path.join(here, '..', '..', 'plugin', '*.lh'))))
+    for fn in files:
+        bench(fn)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - memory used by parsed units.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Parses each unit named on the command line in a child process and
+reports the memory its object model takes:
+
+ - rss: resident set growth over the parse, and the peak (maxrss);
+ - per IR class: instance count and bytes, and the bytes a __dict__
+   per instance would add (what __slots__ saves);
+ - how many Location references share each Location object.
+"""
+
+import os, os.path, sys, gc, resource
+import cPickle as pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import lighthouse.input
+import lighthouse.statements as statements
+import lighthouse.expression as expression
+import lighthouse.decl as decl
+import lighthouse.bb as bb
+import lighthouse.misc as misc
+
+CLASSES = (statements.Assignment, statements.Cond, statements.Call,
+           statements.Ret, statements.Switch,
+           expression.Bound, expression.MemberRef, expression.ItemRef,
+           expression.Indirect, expression.BinaryOp, expression.UnaryOp,
+           decl.Decl, decl.Binding, misc.Location, bb.Block)
+
+def rss():
+    """
+    Current resident set size in KB, or None if it cannot be read.
+    """
+    try:
+        pages = int(open('/proc/self/statm').read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize() / 1024
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def slot_names(cls):
+    names = []
+    for c in cls.__mro__:
+        names.extend(c.__dict__.get('__slots__', ()))
+    return names
+
+def dict_cost(cls):
+    """
+    Bytes a __dict__ holding the attributes of 'cls' would take, plus its
+    pointer in the instance.
+    """
+    names = slot_names(cls)
+    if not names:
+        return 0
+    return sys.getsizeof(dict.fromkeys(names)) + 8
+
+def measure(fn):
+    gc.collect()
+    before, peak = rss(), maxrss()
+    u = lighthouse.input.parse(fn, cache = False)
+    gc.collect()
+    after = rss()
+
+    counts = dict((c.__name__, [0, 0, 0]) for c in CLASSES)
+    for o in gc.get_objects():
+        c = type(o)
+        if c in CLASSES:
+            n = counts[c.__name__]
+            n[0] += 1
+            n[1] += sys.getsizeof(o)
+            if hasattr(o, '__dict__'):
+                n[1] += sys.getsizeof(o.__dict__)
+            else:
+                n[2] += dict_cost(c)
+
+    refs = 0
+    for f in u.functions:
+        refs += f.location is not None
+        for d in f.argument_decls + f.local_decls.values() + f.externals.values():
+            refs += d.location is not None
+        for b in f.blocks.values():
+            for s in b.statements:
+                refs += s.location is not None
+
+    return dict(file = fn,
+                rss = after is not None and after - before or None,
+                maxrss = maxrss() - peak,
+                counts = counts,
+                location_refs = refs)
+
+def in_child(fn):
+    """
+    Runs measure(fn) in a fresh child, so units don't share a heap.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            m = measure(fn)
+        except Exception, e:
+            m = dict(file = fn, error = '%s: %s' % (e.__class__.__name__, e))
+        os.write(w, pickle.dumps(m))
+        os._exit(0)
+    os.close(w)
+    data = ''
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        data += chunk
+    os.close(r)
+    os.waitpid(pid, 0)
+    return pickle.loads(data)
+
+def report(m):
+    print '%s' % m['file']
+    if 'error' in m:
+        print '  failed to parse:', m['error']
+        print
+        return
+    print '  rss growth %s KB, maxrss growth %d KB' % (m['rss'], m['maxrss'])
+    print '  %-12s %10s %12s %14s' % ('class', 'count', 'bytes', 'dict saving')
+    total = [0, 0, 0]
+    for name, (n, size, saved) in sorted(m['counts'].items()):
+        if n:
+            print '  %-12s %10d %12d %14d' % (name, n, size, saved)
+            total = [total[0] + n, total[1] + size, total[2] + saved]
+    print '  %-12s %10d %12d %14d' % ('total', total[0], total[1], total[2])
+    locs = m['counts']['Location'][0]
+    if locs:
+        print '  %d location references share %d Locations (%.2f each)' % \
+            (m['location_refs'], locs, m['location_refs'] / float(locs))
+    print
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print >>sys.stderr, 'usage: %s unit.lh...' % sys.argv[0]
+        sys.exit(1)
+    for fn in sys.argv[1:]:
+        report(in_child(fn))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - parse and analysis benchmark suite.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Times each stage of processing a unit, over synthetic units which vary
+the function count, blocks per function, switch width and type graph
+depth (see lighthouse/synth.py), and over the samples in plugin/:
+
+ - xml: reading the document into an element tree;
+ - decode: converting types and function bodies to the object model
+   (lighthouse.input.decode);
+ - finalise: Unit.finalise;
+ - order: blocks_in_natural_order for every function;
+ - analyse: running the site checkers;
+ - present: codepresentation.format_source, and the JSON control flow
+   graph of every function, as the web front-end makes them.
+
+Each case runs in its own child process, which also reports its peak
+resident set.  Times are the best of --repeat runs.
+
+Results can be saved with --save and compared with a later run with
+--baseline; a stage more than --tolerance slower than the baseline (or
+a peak more than that much larger) is a regression, and the suite exits
+with status 1.  Samples which fail to parse (eg. written by an older
+plugin) are skipped.
+"""
+
+import os, os.path, sys, time, gc, json, resource, tempfile, optparse
+import cPickle as pickle
+
+here = os.path.dirname(os.path.abspath(__file__))
+backend = os.path.join(here, '..')
+sys.path.insert(0, backend)
+sys.path.insert(0, os.path.join(backend, 'server'))
+sys.path.insert(0, os.path.join(backend, '..', 'server')) # utils, for bbgraph
+
+from lighthouse.etree import etree
+import lighthouse.input
+import lighthouse.analysis as analysis
+import lighthouse.diagnostics as diagnostics
+import lighthouse.synth as synth
+import codepresentation
+import codepresentation.bbgraph as bbgraph
+
+STAGES = ('xml', 'decode', 'finalise', 'order', 'analyse', 'present')
+
+# name -> corpus parameters, before scaling.
+CASES = [
+    ('base', dict(functions = 20, blocks = 16)),
+    ('functions', dict(functions = 200, blocks = 16)),
+    ('blocks', dict(functions = 4, blocks = 512)),
+    ('switch', dict(functions = 10, blocks = 32, shape = 'switch', switch_width = 256)),
+    ('types', dict(functions = 20, blocks = 16, types = 400, type_depth = 40)),
+]
+
+SAMPLES = ('helloworld.c.lh', 'hello.cc.lh')
+
+# time below which differences are noise.
+MIN_TIME = 0.02
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def best(repeat, fn, *args):
+    """
+    Returns (fastest time, result) of 'repeat' calls of fn(*args).
+    """
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.time()
+        r = fn(*args)
+        times.append(time.time() - start)
+    return min(times), r
+
+# --- the stages.
+decode = lighthouse.input.decode
+
+def finalise(e):
+    u = decode(e)
+    start = time.time()
+    u.finalise()
+    return time.time() - start, u
+
+def order(u):
+    for f in u.functions:
+        f.invalidate_block_order()
+        f.blocks_in_natural_order()
+
+def analyse(u, analysers):
+    sink = diagnostics.MemorySink()
+    analysis.analyse(u, analysers, sink)
+    return len(sink.diagnostics)
+
+def present(u):
+    codepresentation.format_source(u)
+    for f in u.functions:
+        json.dumps(bbgraph.describe(f))
+
+def measure(fn, repeat):
+    analysers = analysis.AnalyserRegistry([os.path.join(backend, 'analysers', 'checkers.py')]).analysers()
+    gc.collect()
+    base = maxrss()
+    r = dict(size = os.path.getsize(fn))
+
+    r['xml'], e = best(repeat, lambda: etree.parse(fn).getroot())
+    r['decode'], u = best(repeat, decode, e)
+    r['finalise'] = min([finalise(e)[0] for i in range(repeat)])
+    u = finalise(e)[1]
+    del e
+    r['order'] = best(repeat, order, u)[0]
+    r['analyse'], r['diagnostics'] = best(repeat, analyse, u, analysers)
+    r['present'] = best(repeat, present, u)[0]
+
+    r['functions'] = len(u.functions)
+    r['blocks'] = sum([len(f.blocks) for f in u.functions])
+    r['maxrss'] = maxrss()
+    r['maxrss_growth'] = r['maxrss'] - base
+    return r
+
+def in_child(fn, *args, **kw):
+    """
+    Returns fn(*args, **kw), computed in a fresh child so that cases do not
+    share a heap (or a peak).
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            v = fn(*args, **kw)
+        except Exception, e:
+            v = dict(error = '%s: %s' % (e.__class__.__name__, e))
+        os.write(w, pickle.dumps(v))
+        os._exit(0)
+    os.close(w)
+    data = ''
+    while True:
+        chunk = os.read(r, 65536)
+        if not chunk:
+            break
+        data += chunk
+    os.close(r)
+    os.waitpid(pid, 0)
+    return pickle.loads(data)
+
+def quietly(fn, *args):
+    # the old samples make the readers complain a lot.
+    old = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        return fn(*args)
+    finally:
+        sys.stdout = old
+
+# --- the corpus.
+def corpus_files(where, scale, seed):
+    """
+    Generates the synthetic units into 'where' (each in a child, so the
+    generator's peak is not counted), returning [(name, file)].
+    """
+    out = []
+    for name, params in CASES:
+        params = dict(params, seed = seed)
+        params['functions'] = max(1, int(params['functions'] * scale))
+        fn = os.path.join(where, '%s.lh' % name)
+        if not os.path.exists(fn):
+            in_child(synth.generate, fn, **params)
+        out.append((name, fn))
+    plugin = os.path.normpath(os.path.join(backend, '..', 'plugin'))
+    for name in SAMPLES:
+        fn = os.path.join(plugin, name)
+        if os.path.exists(fn):
+            out.append((name, fn))
+    return out
+
+# --- reporting.
+def report(name, r):
+    if 'error' in r:
+        print '%-16s skipped: %s' % (name, r['error'])
+        return
+    print '%-16s %9d %6d %7d' % (name, r['size'] / 1024, r['functions'], r['blocks']),
+    for s in STAGES:
+        print '%8.3f' % r[s],
+    print '%9d' % r['maxrss']
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the stages of 'results' which are worse than 'baseline',
+    returning how many there were.
+    """
+    bad = 0
+    for name, r in results:
+        old = baseline.get(name)
+        if old is None or 'error' in r or 'error' in old:
+            continue
+        for s in STAGES + ('maxrss',):
+            if s not in old:
+                continue
+            limit = old[s] * (1 + tolerance)
+            if s != 'maxrss':
+                limit = max(limit, old[s] + MIN_TIME)
+            if r[s] > limit:
+                fmt = s == 'maxrss' and '%d KB' or '%.3fs'
+                print ('REGRESSION: %s %s: ' + fmt + ', was ' + fmt + ' (%+.0f%%)') % \
+                    (name, s, r[s], old[s], 100.0 * (r[s] - old[s]) / (old[s] or 1))
+                bad += 1
+    return bad
+
+if __name__ == '__main__':
+    p = optparse.OptionParser(usage = '%prog [options] [case...]')
+    p.add_option('-s', '--scale', type = 'float', default = 1.0,
+                 help = 'multiply the function count of each case (default %default)')
+    p.add_option('-r', '--repeat', type = 'int', default = 3,
+                 help = 'runs of each stage (default %default)')
+    p.add_option('--seed', type = 'int', default = 0)
+    p.add_option('-c', '--corpus', default = None,
+                 help = 'keep the generated units in this directory')
+    p.add_option('-b', '--baseline', default = None,
+                 help = 'compare against results saved earlier')
+    p.add_option('-t', '--tolerance', type = 'float', default = 0.25,
+                 help = 'fraction by which a stage may be worse than the baseline (default %default)')
+    p.add_option('-o', '--save', default = None,
+                 help = 'save the results here')
+    opts, args = p.parse_args()
+
+    where = opts.corpus or tempfile.mkdtemp(prefix = 'lh-bench-')
+    if not os.path.isdir(where):
+        os.makedirs(where)
+
+    print '%-16s %9s %6s %7s' % ('case', 'KB', 'fns', 'blocks'),
+    for s in STAGES:
+        print '%8s' % s,
+    print '%9s' % 'maxrss'
+
+    results = []
+    for name, fn in corpus_files(where, opts.scale, opts.seed):
+        if args and name not in args:
+            continue
+        r = in_child(quietly, measure, fn, opts.repeat)
+        report(name, r)
+        results.append((name, r))
+
+    if not opts.corpus:
+        for name in os.listdir(where):
+            os.unlink(os.path.join(where, name))
+        os.rmdir(where)
+
+    if opts.save:
+        json.dump(dict(results), open(opts.save, 'w'), indent = 1, sort_keys = True)
+
+    if opts.baseline:
+        bad = compare(results, json.load(open(opts.baseline)), opts.tolerance)
+        if bad:
+            print '%d regressions against %s' % (bad, opts.baseline)
+            sys.exit(1)
+        print 'no regressions against %s' % opts.baseline
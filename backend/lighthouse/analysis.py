@@ -17,10 +17,20 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import os.path
+import os, os.path
 import sys
+import copy
+import time
+import signal
+import threading
+import resource
 
-import lighthouse.statements as statements
+import lighthouse.diagnostics as diagnostics
+import lighthouse.instrument as instrument
+from lighthouse.misc import in_critical, defer
+
+ANALYSER_BUDGET_ENV = 'LH_ANALYSER_BUDGET'
+UNIT_BUDGET_ENV = 'LH_UNIT_BUDGET'
 
 g_analysers = []
 
@@ -35,6 +45,7 @@ class AnalysisBase(object):
         """
         g_analysers.append(self)
         self.unit = None # current unit
+        self.sink = None # where diagnostics go; None for the default
     
     def check_unit(self, unit):
         """
@@ -42,23 +53,55 @@ class AnalysisBase(object):
         """
         self.unit = unit
     
+    def for_unit(self, unit, sink):
+        """
+        Returns a copy of this analyser to run over 'unit', sending its
+        diagnostics to 'sink'.  Loaded analysers are shared by every call
+        of analyse(), which may be in several threads at once, so each
+        call runs its own copies.
+        """
+        a = copy.copy(self)
+        a.unit = unit
+        a.sink = sink
+        return a
+    
     def warn(self, message, location = dict(), cls = 'Warning'):
-        f = sys.stderr
-        print >>f, 'lighthouse:', cls + ':', message
-        
-        for label, stmt in location.iteritems():
-            if stmt and stmt.location:
-                print >>f, '  ', label, 'at:', stmt.location
-                print >>f, stmt.location.highlight(self.unit.source, label)
-            print >>f
+        """
+        Reports a diagnostic.  'location' maps labels to the statements
+        they describe.
+        """
+        mark = instrument.start('warn', False)
+        try:
+            locations = [(label, stmt and stmt.location or None)
+                         for label, stmt in location.iteritems()]
+            d = diagnostics.Diagnostic(self.__class__.__name__, cls, message,
+                                       locations, self.unit)
+            (self.sink or diagnostics.default_sink).emit(d)
+        finally:
+            instrument.stop(mark)
+        instrument.count('diagnostics')
         
     def error(self, message, location = dict()):
         self.warn(message, location = location, cls = 'Error')
         raise StopAnalysis
 
+    def truncated(self, reason):
+        """
+        Records that this analyser did not finish the current unit.
+        """
+        self.warn('Analysis truncated: %s %s.' % (self.__class__.__name__, reason),
+                  cls = 'Truncated')
+
 class StopAnalysis(Exception):
     pass
 
+class BudgetExceeded(BaseException):
+    """
+    Raised in an analyser which has used up its time.  This is not an
+    Exception, so checkers which catch everything do not swallow it.
+    """
+    pass
+
 class FunctionCallAnalyser(AnalysisBase):
     @staticmethod
     def Handler(name = None):
@@ -74,18 +117,39 @@ class FunctionCallAnalyser(AnalysisBase):
     def __init__(self):
         AnalysisBase.__init__(self)
         self.handlers = {}
+        self._enum_handlers()
         
+    def for_unit(self, unit, sink):
+        a = AnalysisBase.for_unit(self, unit, sink)
+        # the handlers are bound to this analyser, not to the copy.
+        a.handlers = {}
+        for called, fn in self.handlers.iteritems():
+            if getattr(fn, 'im_self', None) is self:
+                fn = fn.im_func.__get__(a, type(a))
+            a.handlers[called] = fn
+        return a
+
     def handle(self, unit, stmt):
         called = stmt.fnexpr.to_c()
         
         if called in self.handlers:
-            try:
-                self.handlers[called](stmt, stmt.lhs, stmt.args)
-            except StopAnalysis:
-                pass
-            except Exception:
-                self.warn("Python exception raised.", location = {'when processing statement': stmt})
-                raise
+            self._dispatch(called, stmt)
+
+    def _dispatch(self, called, stmt):
+        mark = None
+        if instrument.active():
+            instrument.count('calls')
+            mark = instrument.start('handler:%s.%s' % (self.__class__.__name__, called), False)
+        try:
+            check_budget()
+            self.handlers[called](stmt, stmt.lhs, stmt.args)
+        except StopAnalysis:
+            pass
+        except Exception:
+            self.warn("Python exception raised.", location = {'when processing statement': stmt})
+            raise
+        finally:
+            instrument.stop(mark)
 
     def _enum_handlers(self):
         """
@@ -98,16 +162,16 @@ class FunctionCallAnalyser(AnalysisBase):
 
     def check_unit(self, unit):
         AnalysisBase.check_unit(self, unit)
-        
-        self._enum_handlers()
     
-        for fn in unit.functions:
-            for block in fn.blocks_in_natural_order():
-                for stmt in block.statements:
-                    if isinstance(stmt, statements.Call):
-                        self.handle(unit, stmt)
+        for called, fn, block, stmt in unit.calls_to(self.handlers.keys()):
+            self._dispatch(called, stmt)
 
 def _load_from(where):
+    """
+    Runs the checker file 'where', returning the analysers it registered.
+    """
+    global g_analysers
+    g_analysers = []
     g = dict()
     
     if os.path.isfile(where):
@@ -121,31 +185,206 @@ def _load_from(where):
         finally:
             sys.path = oldpath
         
-    return g.values()
+    return g_analysers
 
-def _load_site_analysers():
+def _site_analysers_path():
     here = os.path.realpath(os.path.dirname(os.path.realpath(sys.argv[0])))
-    _load_from(os.path.join(here, 'analysers/checkers.py'))
+    return os.path.join(here, 'analysers/checkers.py')
 
-def _load_user_analysers():
-    _load_from(os.path.expanduser('~/.lh/checkers.py'))
+def _user_analysers_path():
+    return os.path.expanduser('~/.lh/checkers.py')
 
-def _enumerate_analysers():
-    global g_analysers
-    g_analysers = []
+class AnalyserRegistry(object):
+    """
+    The analysers registered by a list of checker files.  Each file is run
+    once, and again only if its modification time changes.  (Modules the
+    checker file imports are not reloaded.)
+    """
+    def __init__(self, paths = None):
+        """
+        'paths' defaults to the user's then the site's checkers.py.
+        """
+        self.paths = paths
+        self.loaded = {} # path -> (mtime, analysers)
+
+    def analysers(self):
+        out = []
+        for path in self.paths or [_user_analysers_path(), _site_analysers_path()]:
+            out.extend(self._load(path))
+        return out
+
+    def _load(self, path):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self.loaded.pop(path, None)
+            return []
+        
+        entry = self.loaded.get(path)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, _load_from(path))
+            self.loaded[path] = entry
+        return entry[1]
+
+g_registry = AnalyserRegistry()
+
+def load_analysers():
+    """
+    Returns the analysers registered by the site and user checkers,
+    loading them if they are new or have changed.
+    """
+    return g_registry.analysers()
+
+# --- time budgets.
+# getrusage(RUSAGE_THREAD) is Linux only, and Python 2 does not name it.
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', sys.platform.startswith('linux') and 1 or None)
+
+g_budget = threading.local()
+
+def _main_thread():
+    return threading.current_thread().name == 'MainThread'
+
+def cpu_time():
+    """
+    CPU seconds used by the calling thread, or None if that cannot be
+    measured.  Without per-thread accounting, the process's time is used
+    in the main thread only: elsewhere it would include other threads'.
+    """
+    if RUSAGE_THREAD is not None:
+        r = resource.getrusage(RUSAGE_THREAD)
+        return r.ru_utime + r.ru_stime
+    if _main_thread():
+        return time.clock()
+    return None
+
+def check_budget():
+    """
+    Raises BudgetExceeded if the analyser running in this thread has used
+    up its time.  This is done before each call is dispatched to a
+    handler; checkers which loop for long without any can call it too.
+    """
+    deadline = getattr(g_budget, 'deadline', None)
+    if deadline is not None and cpu_time() >= deadline:
+        raise BudgetExceeded
+
+def _on_budget(signum, frame):
+    if in_critical():
+        defer(BudgetExceeded())
+    else:
+        raise BudgetExceeded
+
+class Watchdog(object):
+    """
+    Raises BudgetExceeded once the calling thread has used 'seconds' of
+    CPU time after start().  In the main thread a profiling timer raises
+    it wherever the analyser is; signals can only be handled there, so
+    other threads set a deadline which check_budget() enforces.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.old = None
+        self.armed = False
+        self.deadline = None
+
+    def start(self):
+        if not self.seconds:
+            return
+        now = cpu_time()
+        if now is not None:
+            self.deadline = getattr(g_budget, 'deadline', None)
+            g_budget.deadline = now + self.seconds
+        if _main_thread():
+            self.old = signal.signal(signal.SIGPROF, _on_budget)
+            self.armed = True
+            signal.setitimer(signal.ITIMER_PROF, self.seconds)
+
+    def stop(self):
+        if self.armed:
+            self.armed = False
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.old)
+        if self.seconds:
+            g_budget.deadline = self.deadline
+
+def budget_from_env(name):
+    """
+    Returns the budget in seconds set by the environment variable 'name',
+    or None for no limit.
+    """
+    try:
+        seconds = float(os.environ.get(name) or 0)
+    except ValueError:
+        return None
+    return seconds > 0 and seconds or None
+
+def _run(a, unit, limit):
+    """
+    Runs analyser 'a' over 'unit' for at most 'limit' CPU seconds (None
+    for no limit), returning the CPU time this thread spent on it.
+    """
+    start = cpu_time()
+    watchdog = Watchdog(limit)
+    try:
+        try:
+            watchdog.start()
+            try:
+                a.check_unit(unit)
+            finally:
+                watchdog.stop()
+        except StopAnalysis:
+            pass
+    except BudgetExceeded:
+        watchdog.stop()
+        _overrun(a, 'used up its budget of %gs' % limit)
+    if start is None:
+        return 0.0
+    return cpu_time() - start
+
+def _overrun(a, reason):
+    instrument.count('budget_overruns')
+    instrument.count('budget_overruns:' + a.__class__.__name__)
+    a.truncated(reason)
+
+def analyse(unit, analysers = None, sink = None, budget = None, unit_budget = None):
+    """
+    Runs each analyser over 'unit'.  'analysers' defaults to those
+    registered by the site and user checkers; diagnostics go to 'sink',
+    or are printed to stderr.
     
-    _load_user_analysers()
-    _load_site_analysers()
+    'budget' limits the CPU seconds each analyser may spend on the unit,
+    and 'unit_budget' those of all the analysers together.  They default
+    to the LH_ANALYSER_BUDGET and LH_UNIT_BUDGET environment variables,
+    and when neither is set there is no limit.  An analyser which runs
+    out of time is abandoned for this unit, with a 'Truncated'
+    diagnostic to say so.  Time is counted per thread, so units analysed
+    at once in different threads do not use up each other's budgets.
+    Outside the main thread, budgets are only enforced as calls are
+    dispatched (see check_budget).
+    """
+    if analysers is None:
+        analysers = load_analysers()
+    if budget is None:
+        budget = budget_from_env(ANALYSER_BUDGET_ENV)
+    if unit_budget is None:
+        unit_budget = budget_from_env(UNIT_BUDGET_ENV)
     
-    return g_analysers
-
-def analyse(unit):
-    for a in _enumerate_analysers():
+    left = unit_budget
+    for a in analysers:
         if isinstance(a, AnalysisBase):
+            a = a.for_unit(unit, sink)
+            limit = budget
+            if left is not None:
+                if left <= 0:
+                    _overrun(a, 'was not run: the unit used up its budget of %gs' % unit_budget)
+                    continue
+                limit = min(limit or left, left)
+            mark = instrument.start('check_unit:' + a.__class__.__name__)
             try:
-                a.check_unit(unit)
-            except StopAnalysis:
-                pass
+                used = _run(a, unit, limit)
+            finally:
+                instrument.stop(mark)
+            if left is not None:
+                left -= used
         else:
             pass # ignore unsuitable things
     return 0
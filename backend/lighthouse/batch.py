@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - batch analysis of saved units.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Runs the checkers over many saved .lh files using a pool of worker
+processes, each of which loads the checkers once.
+
+One JSON object is written per line for each file, as soon as it is
+done:
+
+  {"file": ..., "status": "ok" | "error" | "timeout",
+   "rc": ..., "output": ..., "diagnostics": [...], "elapsed": ...}
+
+where 'output' is the text lh-pipe would have written to stderr and
+'diagnostics' holds the same findings as Diagnostic.to_dict()
+records.  Records come out in completion order.  When resuming, files
+already recorded in the output are skipped.
+
+When profiling is on (see lighthouse.instrument), each record also has
+the unit's 'profile', and the totals over the run are written to the
+profile output at the end.
+"""
+
+import os, os.path, sys, signal, time, traceback
+import json
+import multiprocessing
+from cStringIO import StringIO
+
+import lighthouse.input
+import lighthouse.analysis
+import lighthouse.diagnostics as diagnostics
+import lighthouse.instrument as instrument
+from lighthouse.misc import in_critical, defer
+
+SUFFIX = '.lh'
+
+class Timeout(BaseException):
+    """
+    Raised when a file takes too long.  Like analysis.BudgetExceeded,
+    this is not an Exception, so checkers which catch everything do not
+    swallow it.
+    """
+    pass
+
+def find_units(paths):
+    """
+    Yields the .lh files named by 'paths', descending into directories.
+    """
+    for p in paths:
+        if os.path.isdir(p):
+            for where, dirs, files in os.walk(p):
+                dirs.sort()
+                for fn in sorted(files):
+                    if fn.endswith(SUFFIX):
+                        yield os.path.join(where, fn)
+        else:
+            yield p
+
+def recorded(fn):
+    """
+    Returns the set of files with a record in the output file 'fn'.
+    A partly written last line (from a crash) is ignored.
+    """
+    done = set()
+    try:
+        f = open(fn)
+    except IOError:
+        return done
+
+    for line in f:
+        try:
+            done.add(json.loads(line)['file'])
+        except (ValueError, KeyError, TypeError):
+            pass
+    f.close()
+    return done
+
+# --- worker processes.
+g_timeout = None
+
+def _on_alarm(signum, frame):
+    if in_critical():
+        defer(Timeout())
+    else:
+        raise Timeout
+
+def _init_worker(timeout):
+    global g_timeout
+    # ^C is for the parent, which tears the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    g_timeout = timeout
+    lighthouse.analysis.load_analysers()
+
+def _analyse(fn):
+    """
+    Parses and analyses the unit in 'fn', returning its record.
+    """
+    out = StringIO()
+    found = diagnostics.MemorySink()
+    sink = diagnostics.TeeSink(diagnostics.StderrSink(out), found)
+    old = sys.stderr
+    sys.stderr = out
+    start = time.time()
+    status, rc = 'ok', 0
+    unit = None
+    instrument.begin_unit()
+    try:
+        try:
+            if g_timeout:
+                signal.alarm(g_timeout)
+            try:
+                # archived files are read once: do not fill the cache.
+                unit = lighthouse.input.parse(fn, cache = False)
+                rc = lighthouse.analysis.analyse(unit, sink = sink)
+            finally:
+                signal.alarm(0)
+        except Timeout:
+            print >>out, 'lighthouse: timed out after %ds' % g_timeout
+            status, rc = 'timeout', 1
+        except Exception:
+            traceback.print_exc()
+            status, rc = 'error', 1
+    finally:
+        sys.stderr = old
+    rec = dict(file = fn, status = status, rc = rc,
+               output = out.getvalue(),
+               diagnostics = [d.to_dict() for d in found.diagnostics],
+               elapsed = round(time.time() - start, 3))
+    profile = instrument.end_unit(unit, write = False)
+    if profile is not None:
+        rec['profile'] = profile
+    return rec
+
+# --- driver.
+def run(paths, out = None, jobs = None, timeout = None, skip = ()):
+    """
+    Analyses the units named by 'paths' (files or directories), writing
+    a record per file to 'out' (default stdout) and skipping any file
+    in 'skip'.  Returns a dict counting the records by status.
+    """
+    out = out or sys.stdout
+    files = list(find_units(paths))
+    counts = dict(ok = 0, error = 0, timeout = 0)
+    if skip:
+        kept = [fn for fn in files if fn not in skip]
+        counts['skipped'] = len(files) - len(kept)
+        files = kept
+    else:
+        counts['skipped'] = 0
+    if not files:
+        return counts
+
+    totals = instrument.Totals()
+    pool = multiprocessing.Pool(jobs, _init_worker, (timeout,))
+    try:
+        for rec in pool.imap_unordered(_analyse, files):
+            out.write(json.dumps(rec) + '\n')
+            out.flush()
+            counts[rec['status']] += 1
+            if 'profile' in rec:
+                instrument.emit(rec['profile'])
+                totals.add(rec['profile'])
+        pool.close()
+        if totals.units:
+            instrument.emit(totals.summary())
+    except BaseException:
+        # ^C, or a failure writing 'out': join() needs the pool stopped.
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return counts
+
+def _reopen(fn):
+    """
+    Opens the output file 'fn' for appending, finishing any line
+    left partly written by a crash.
+    """
+    f = open(fn, 'a+b')
+    f.seek(0, 2)
+    if f.tell():
+        f.seek(-1, 2)
+        if f.read(1) != '\n':
+            f.seek(0, 2)
+            f.write('\n')
+    return f
+
+def main(paths, output = None, jobs = None, timeout = None, resume = False):
+    skip = set()
+    if output and output != '-':
+        if resume:
+            skip = recorded(output)
+            out = _reopen(output)
+        else:
+            out = open(output, 'w')
+    else:
+        out = sys.stdout
+
+    try:
+        counts = run(paths, out, jobs, timeout, skip)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print >>sys.stderr, 'lh-batch: %d ok, %d failed, %d timed out, %d skipped' % \
+        (counts['ok'], counts['error'], counts['timeout'], counts['skipped'])
+    return int(bool(counts['error'] or counts['timeout']))
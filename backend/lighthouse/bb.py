@@ -20,6 +20,8 @@
 import lighthouse.statements as statements
 
 class Block(object):
+    __slots__ = ('id', 'statements', 'next')
+
     def __init__(self):
         self.id = 0
         self.statements = []
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - on-disk cache of finalised units.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Finalised units are pickled and compressed into a cache directory, named
+by the SHA-1 of the XML they came from and by SCHEMA_VERSION.  Bump
+SCHEMA_VERSION whenever the object model changes shape, so that stale
+entries are never loaded (they age out by themselves).
+
+The cache is off unless the LH_CACHE environment variable names its
+directory ('on' means ~/.lh/cache).  A miss costs more than parsing the
+XML alone, so it only pays when the same units are read again: by a
+daemon, or by repeated runs over an unchanged tree.
+
+Trimming lists and stats every entry, so it is done only when this
+process has stored more than the cache can hold since it last trimmed,
+or, in a process which has not trimmed yet, when no process has trimmed
+for TRIM_INTERVAL.
+"""
+
+import os, os.path, time, errno, tempfile, zlib, gc
+import cPickle as pickle
+from hashlib import sha1
+
+SCHEMA_VERSION = 10
+
+DEFAULT_PATH = '~/.lh/cache'
+MAX_SIZE = 256 * 1024 * 1024    # bytes, over all entries
+MAX_AGE = 14 * 24 * 60 * 60     # seconds since an entry was last used
+TRIM_INTERVAL = 10 * 60         # seconds
+LOW_WATER = 0.75                # of max_size, left by trimming for size
+
+CHUNK = 64 * 1024
+SUFFIX = '.lhc'
+STAMP = 'trimmed'
+
+class UnitCache(object):
+    """
+    A directory of cached units, bounded by total size and entry age.
+    """
+    def __init__(self, path, max_size = MAX_SIZE, max_age = MAX_AGE):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.used = None # total size at the last trim, if this process did it
+        self.stored = 0  # bytes stored since
+
+    def entry(self, digest):
+        return os.path.join(self.path, '%s.v%d%s' % (digest, SCHEMA_VERSION, SUFFIX))
+
+    def load(self, digest):
+        """
+        Returns the unit stored under 'digest', or None.
+        """
+        fn = self.entry(digest)
+        try:
+            data = open(fn, 'rb').read()
+        except IOError:
+            self.misses += 1
+            return None
+
+        try:
+            u = _without_gc(pickle.loads, zlib.decompress(data))
+        except Exception:
+            # truncated, or written by an incompatible version.
+            self._remove(fn)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(fn, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return u
+
+    def store(self, digest, u):
+        """
+        Stores the unit 'u' under 'digest', then trims the cache if it is
+        due.  Failure to store is not an error.
+        """
+        try:
+            data = _without_gc(pickle.dumps, u, pickle.HIGHEST_PROTOCOL)
+            data = zlib.compress(data, 1)
+        except (RuntimeError, pickle.PicklingError):
+            # eg. recursion limit on very deep type graphs
+            return
+
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            fd, tmp = tempfile.mkstemp(suffix = '.tmp', dir = self.path)
+        except (IOError, OSError):
+            return
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmp, self.entry(digest))
+        except (IOError, OSError):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+
+        self.stored += len(data)
+        if self._trim_due():
+            self.trim()
+
+    def _trim_due(self):
+        if self.used is not None:
+            return self.used + self.stored > self.max_size
+        try:
+            last = os.stat(os.path.join(self.path, STAMP)).st_mtime
+        except OSError:
+            return True
+        return time.time() - last > TRIM_INTERVAL
+
+    def trim(self):
+        """
+        Removes entries older than max_age, then, if the total size is
+        over max_size, the least recently used entries until it is under
+        LOW_WATER of that (so that the next trim is not due at once).
+        Temporary files left by writers which died are removed once they
+        are as old.
+        """
+        now = time.time()
+        entries = []
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith(SUFFIX) and not name.endswith('.tmp'):
+                continue
+            fn = os.path.join(self.path, name)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            if now - st.st_mtime > self.max_age:
+                self._remove(fn)
+            elif name.endswith(SUFFIX):
+                entries.append((st.st_mtime, st.st_size, fn))
+
+        total = sum([size for mtime, size, fn in entries])
+        entries.sort()
+        if total > self.max_size:
+            limit = self.max_size * LOW_WATER
+        else:
+            limit = self.max_size
+        while entries and total > limit:
+            mtime, size, fn = entries.pop(0)
+            self._remove(fn)
+            total -= size
+
+        self.used = total
+        self.stored = 0
+        try:
+            open(os.path.join(self.path, STAMP), 'w').close()
+        except IOError:
+            pass
+
+    def _remove(self, fn):
+        try:
+            os.unlink(fn)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+
+def _without_gc(fn, *args):
+    """
+    Calls fn(*args) with the cyclic garbage collector paused.  (Pickling
+    creates or visits millions of small objects, and collections
+    triggered part way through dominate the cost.)
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return fn(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+def digest_file(fn):
+    """
+    Returns the hex SHA-1 of the contents of the file named 'fn'.
+    """
+    f = open(fn, 'rb')
+    try:
+        return digest_stream(f)
+    finally:
+        f.close()
+
+def digest_stream(f):
+    """
+    Returns the hex SHA-1 of the rest of file object 'f'.
+    """
+    h = sha1()
+    while True:
+        chunk = f.read(CHUNK)
+        if not chunk:
+            break
+        h.update(chunk)
+    return h.hexdigest()
+
+def seekable(f):
+    try:
+        f.seek(f.tell())
+    except (AttributeError, IOError, OSError):
+        return False
+    return True
+
+class Hashing(object):
+    """
+    Reads file object 'f', hashing what is read.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.hash = sha1()
+
+    def read(self, n = -1):
+        data = self.f.read(n)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self):
+        # the parser may stop at the end of the root element.
+        while self.read(CHUNK):
+            pass
+        return self.hash.hexdigest()
+
+def digest_string(data):
+    return sha1(data).hexdigest()
+
+_default = None
+
+def default():
+    """
+    Returns the process-wide UnitCache configured by LH_CACHE, or
+    None if caching is disabled.
+    """
+    global _default
+    path = os.environ.get('LH_CACHE', '')
+    if path in ('', 'off'):
+        return None
+    if path == 'on':
+        path = DEFAULT_PATH
+    if _default is None or _default.path != os.path.expanduser(path):
+        _default = UnitCache(path)
+    return _default
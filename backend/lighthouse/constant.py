@@ -26,7 +26,7 @@ class ConstantBase(object):
     def get_value(self):
         return self.value
     def to_c(self):
-        return self.value
+        return str(self.value)
 
 class ConstantString(ConstantBase):
     def __init__(self, type, value):
@@ -53,13 +53,14 @@ class ConstantFloat(ConstantBase):
       else:
           self.value = decimal.Decimal(value.get('value'))
 
-def convert(t):
-    kinds = {'string-literal': ConstantString,
-             'integer-literal': ConstantInteger,
-             'float-literal': ConstantFloat}
+constant_kinds = {'string-literal': ConstantString,
+                  'integer-literal': ConstantInteger,
+                  'float-literal': ConstantFloat}
 
+def convert(t):
     assert t.tag == 'constant'
     type, value = t.getchildren()
 
-    assert value.tag in kinds.keys()
-    return kinds[value.tag](type, value)
+    make = constant_kinds.get(value.tag)
+    assert make is not None
+    return make(type, value)
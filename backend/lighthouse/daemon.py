@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - persistent analysis server.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+A long-lived replacement for running lh-pipe once per translation unit.
+
+Clients connect to a unix socket, write the XML of one unit and shut down
+their side of the connection.  The reply is the diagnostic text lh-pipe
+would have written to stderr, a NUL byte, and lh-pipe's exit status in
+decimal followed by a newline.
+
+Each unit is copied from the socket into a temporary file, which one of
+a pool of worker processes parses and analyses; each worker loads the
+checkers when it starts (and again only if they change).  A unit with no
+result after 'timeout' seconds (its worker died, or is stuck) gets an
+error reply, so the compiler is never left waiting.
+"""
+
+import os, os.path, sys, signal, socket, traceback, tempfile
+import SocketServer
+import multiprocessing
+from cStringIO import StringIO
+
+import lighthouse.input
+import lighthouse.analysis
+import lighthouse.instrument as instrument
+
+SOCKET_ENV = 'LH_SOCKET'
+DEFAULT_SOCKET = '~/.lh/daemon.sock'
+DEFAULT_TIMEOUT = 10 * 60 # seconds
+CHUNK = 64 * 1024
+
+def default_socket():
+    return os.path.expanduser(os.environ.get(SOCKET_ENV, DEFAULT_SOCKET))
+
+# --- worker processes.
+def _init_worker():
+    # ^C is for the parent, which tears the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    lighthouse.analysis.load_analysers()
+
+def _analyse(fn):
+    """
+    Parses and analyses the unit in file 'fn', returning (status,
+    diagnostic text).
+    """
+    out = StringIO()
+    old = sys.stderr
+    sys.stderr = out
+    unit = None
+    instrument.begin_unit()
+    try:
+        try:
+            unit = lighthouse.input.parse(fn)
+            rc = lighthouse.analysis.analyse(unit)
+        except Exception:
+            traceback.print_exc()
+            rc = 1
+    finally:
+        sys.stderr = old
+        instrument.end_unit(unit)
+    return rc, out.getvalue()
+
+# --- connections.
+class UnitHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        fd, fn = tempfile.mkstemp(prefix = 'lh-daemon-', suffix = '.lh')
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                size = 0
+                for chunk in iter(lambda: self.rfile.read(CHUNK), ''):
+                    f.write(chunk)
+                    size += len(chunk)
+            finally:
+                f.close()
+            if not size:
+                return
+            rc, text = self._analyse(fn)
+        finally:
+            os.unlink(fn)
+        self.wfile.write(text)
+        self.wfile.write('\0%d\n' % rc)
+
+    def _analyse(self, fn):
+        timeout = self.server.unit_timeout
+        try:
+            return self.server.pool.apply_async(_analyse, (fn,)).get(timeout)
+        except multiprocessing.TimeoutError:
+            return 1, 'lh-daemon: no result within %gs; the worker died or is stuck\n' % timeout
+        except Exception:
+            return 1, 'lh-daemon: analysis failed\n' + traceback.format_exc()
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, jobs = None, timeout = DEFAULT_TIMEOUT):
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        SocketServer.UnixStreamServer.__init__(self, path, UnitHandler)
+        self.path = path
+        self.unit_timeout = timeout
+        self.pool = multiprocessing.Pool(jobs, _init_worker)
+
+    def close(self):
+        self.server_close()
+        self.pool.terminate()
+        self.pool.join()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def _remove_stale_socket(path):
+    """
+    Removes the socket at 'path' unless another server is listening on it.
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            s.connect(path)
+        except socket.error:
+            os.unlink(path)
+        else:
+            raise SystemExit('lh-daemon: already running on %s' % path)
+    finally:
+        s.close()
+
+def serve(path = None, jobs = None, timeout = DEFAULT_TIMEOUT):
+    path = path or default_socket()
+    where = os.path.dirname(path)
+    if where and not os.path.isdir(where):
+        os.makedirs(where)
+
+    server = Server(path, jobs, timeout)
+    try:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.close()
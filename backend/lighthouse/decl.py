@@ -17,9 +17,11 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-from lighthouse.misc import Location
+from lighthouse.misc import location
 
 class Binding(object):
+    __slots__ = ('id', 'name', 'constant_temporary_value')
+
     def __init__(self):
         self.id = 0
         self.name = None
@@ -44,6 +46,8 @@ class Binding(object):
         return b
 
 class Decl(object):
+    __slots__ = ('location', 'binding', 'decl', 'type')
+
     def __init__(self):
         self.location = None
         self.binding = None
@@ -72,7 +76,7 @@ class Decl(object):
         from lighthouse.types import type_from_xml
         d = Decl()
         if t.get('location'):
-            d.location = Location(t.get('location'))
+            d.location = location(t.get('location'))
         d.binding = Binding.from_xml(t.find('binding'))
         d.type = type_from_xml(t.find('type').getchildren()[0])
         return d
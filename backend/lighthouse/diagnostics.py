@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - diagnostics and where they go.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Analysers report problems as Diagnostic records, which are handed to a
+sink.  The default sink prints them to stderr as lighthouse always has;
+others collect them in memory or write them out as JSON lines or as a
+SARIF log.
+
+Source snippets are only rendered when a sink asks for them.
+"""
+
+import sys
+import json
+
+class Diagnostic(object):
+    """
+    One problem found by one checker.  'locations' is a list of
+    (label, Location) pairs; the Location may be None.
+    """
+    def __init__(self, checker, cls, message, locations = (), unit = None):
+        self.checker = checker
+        self.cls = cls
+        self.message = message
+        self.locations = list(locations)
+        self.unit = unit
+
+    def __repr__(self):
+        return '<Diagnostic %s %s %r>' % (self.checker, self.cls, self.message)
+
+    def key(self):
+        """
+        Identifies the diagnostic for de-duplication.
+        """
+        return (self.checker, self.cls, self.message,
+                tuple([(label, str(loc)) for label, loc in self.locations]))
+
+    def snippet(self, label, loc):
+        """
+        Returns the source around 'loc', marked with 'label'.
+        """
+        return loc.highlight(self.unit.lines, label)
+
+    def format(self):
+        """
+        Returns the diagnostic as lighthouse prints it to stderr.
+        """
+        o = ['lighthouse: %s: %s' % (self.cls, self.message)]
+        for label, loc in self.locations:
+            if loc:
+                o.append('   %s at: %s' % (label, loc))
+                o.append(self.snippet(label, loc))
+            o.append('')
+        return '\n'.join(o) + '\n'
+
+    def to_dict(self, snippets = False):
+        locations = []
+        for label, loc in self.locations:
+            l = dict(label = label)
+            if loc:
+                l.update(file = loc.file, line = loc.line, column = loc.column)
+                if snippets:
+                    l['snippet'] = self.snippet(label, loc)
+            locations.append(l)
+        return dict(checker = self.checker, severity = self.cls,
+                    message = self.message, locations = locations)
+
+class Sink(object):
+    """
+    Sink base class.  emit() is called for each diagnostic, then
+    close() once analysis is over.
+    """
+    def emit(self, diag):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class StderrSink(Sink):
+    """
+    Prints diagnostics to 'f', or to whatever sys.stderr is at the time.
+    """
+    def __init__(self, f = None):
+        self.f = f
+
+    def emit(self, diag):
+        (self.f or sys.stderr).write(diag.format())
+
+class MemorySink(Sink):
+    """
+    Keeps diagnostics in self.diagnostics, dropping repeats if 'unique'.
+    """
+    def __init__(self, unique = False):
+        self.diagnostics = []
+        self.unique = unique
+        self.seen = set()
+
+    def emit(self, diag):
+        if self.unique:
+            k = diag.key()
+            if k in self.seen:
+                return
+            self.seen.add(k)
+        self.diagnostics.append(diag)
+
+class JSONLinesSink(Sink):
+    """
+    Writes each diagnostic to 'f' as a line of JSON.
+    """
+    def __init__(self, f, snippets = False):
+        self.f = f
+        self.snippets = snippets
+
+    def emit(self, diag):
+        self.f.write(json.dumps(diag.to_dict(self.snippets)) + '\n')
+
+class SARIFSink(Sink):
+    """
+    Writes the diagnostics to 'f' as a SARIF 2.1.0 log when closed.
+    """
+    LEVELS = {'Error': 'error', 'Warning': 'warning'}
+
+    def __init__(self, f, tool = 'lighthouse'):
+        self.f = f
+        self.tool = tool
+        self.results = []
+
+    def emit(self, diag):
+        locations = []
+        for label, loc in diag.locations:
+            if not loc:
+                continue
+            region = dict(startLine = loc.line)
+            if loc.column:
+                region['startColumn'] = loc.column
+            locations.append(dict(
+                physicalLocation = dict(artifactLocation = dict(uri = loc.file),
+                                        region = region),
+                message = dict(text = label)))
+        self.results.append(dict(ruleId = diag.checker,
+                                 level = self.LEVELS.get(diag.cls, 'note'),
+                                 message = dict(text = diag.message),
+                                 locations = locations))
+
+    def close(self):
+        rules = sorted(set([r['ruleId'] for r in self.results]))
+        log = {
+            'version': '2.1.0',
+            '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+            'runs': [dict(tool = dict(driver = dict(name = self.tool,
+                                                    rules = [dict(id = r) for r in rules])),
+                          results = self.results)],
+        }
+        json.dump(log, self.f, indent = 2)
+        self.f.write('\n')
+
+class TeeSink(Sink):
+    """
+    Passes each diagnostic to all of 'sinks'.
+    """
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def emit(self, diag):
+        for s in self.sinks:
+            s.emit(diag)
+
+    def close(self):
+        for s in self.sinks:
+            s.close()
+
+default_sink = StderrSink()
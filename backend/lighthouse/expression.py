@@ -34,6 +34,8 @@ def attach_decls_to_bindings(decls, *exprs):
             e.attach_decl(decls)
 
 class Bound(object):
+    __slots__ = ('id', 'decl')
+
     def __init__(self, t = None):
         if t is not None:
             self.id = int(t.get('id'))
@@ -55,6 +57,8 @@ class Bound(object):
             self.decl = decls[self.id]
 
 class MemberRef(object):
+    __slots__ = ('struct', 'member')
+
     def __init__(self, t):
         self.struct = expression_from_xml(descend_one(t.find('structure')))
         self.member = expression_from_xml(descend_one(t.find('member')))
@@ -69,6 +73,8 @@ class MemberRef(object):
         return '%s.%s' % (to_c(self.struct), to_c(self.member))
 
 class ItemRef(object):
+    __slots__ = ('array', 'index')
+
     def __init__(self, t):
         self.array = expression_from_xml(descend_one(t.find('array')))
         self.index = expression_from_xml(descend_one(t.find('index')))
@@ -85,6 +91,8 @@ class ItemRef(object):
         return '%s[%s]' % (to_c(self.array), to_c(self.index))
 
 class Indirect(object):
+    __slots__ = ('thing',)
+
     def __init__(self, t):
         self.thing = result_from_xml(descend_one(t))
         
@@ -98,6 +106,8 @@ class Indirect(object):
         return '*%s' % (to_c(self.thing))
 
 class BinaryOp(object):
+    __slots__ = ('op', 'c')
+
     def __init__(self, tt):
         assert len(tt) == 2
         self.op, self.c = tt
@@ -106,9 +116,11 @@ class BinaryOp(object):
         return self.c
 
 class UnaryOp(BinaryOp):
-    pass
+    __slots__ = ()
  
 class Void(object):
+    __slots__ = ()
+
     def __init__(self):
         pass
     def to_c(self):
@@ -117,12 +129,16 @@ class Void(object):
         return types.Void()
  
 class Result(object):
+    __slots__ = ()
+
     def __init__(self):
         pass
     def to_c(self):
         return '__result'
 
 class AddrOf(object):
+    __slots__ = ('of',)
+
     def __init__(self, t):
         self.of = expression_from_xml(descend_one(t))
     
@@ -146,19 +162,18 @@ class AddrOf(object):
         else:
             return None
 
+result_kinds = {
+    'bound':            Bound,
+    'bound-parameter':  Bound,
+    'member-ref':       MemberRef,
+    'item-ref':         ItemRef,
+    'indirection':      Indirect,
+    'result':           lambda t: Result(),
+}
+
 def result_from_xml(t):
     assert t.tag in valid_lvalues
-
-    if t.tag in ('bound', 'bound-parameter'):
-        return Bound(t)
-    elif t.tag == 'member-ref':
-        return MemberRef(t)
-    elif t.tag == 'item-ref':
-        return ItemRef(t)
-    elif t.tag == 'indirection':
-        return Indirect(t)
-    elif t.tag == 'result':
-        return Result()
+    return result_kinds[t.tag](t)
 
 # XXX marks incorrect operator members which need wrapping.
 binary_operators = {
@@ -212,21 +227,24 @@ unary_operators = {
     'address-of':       (None, '&'),
 }
 
+def _operator(kind, op):
+    return lambda t: kind(op)
+
+# tag -> function making the expression from the element.
+expression_kinds = {
+    'constant':         constant.convert,
+    'addr-of':          AddrOf,
+    'void':             lambda t: Void(),
+    'function':         lambda t: expression_from_xml(descend_one(t)),
+}
+expression_kinds.update((tag, _operator(UnaryOp, op)) for tag, op in unary_operators.items())
+expression_kinds.update((tag, _operator(BinaryOp, op)) for tag, op in binary_operators.items())
+expression_kinds.update(result_kinds)
+
 def expression_from_xml(t):
-    if t.tag in valid_lvalues:
-        return result_from_xml(t)
-    if t.tag in ('constant',):
-        return constant.convert(t)
-    if t.tag in binary_operators.keys():
-        return BinaryOp(binary_operators[t.tag])
-    if t.tag in unary_operators.keys():
-        return UnaryOp(unary_operators[t.tag])
-    if t.tag == 'addr-of':
-        return AddrOf(t)
-    if t.tag == 'void':
-        return Void()
-    if t.tag == 'function':
-        return expression_from_xml(descend_one(t))
+    make = expression_kinds.get(t.tag)
+    if make is not None:
+        return make(t)
 
     print 'warn: tag %s unhandled, returning dummy bound' % (t.tag)
     dump(t)
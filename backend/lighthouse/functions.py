@@ -17,9 +17,12 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+from collections import deque
+
 import lighthouse.types as types
 import lighthouse.decl as decl
-from lighthouse.misc import descend_one, to_c, Location
+import lighthouse.instrument as instrument
+from lighthouse.misc import descend_one, to_c, location
 from lighthouse.bb import Block
 
 class Bounds:
@@ -39,9 +42,25 @@ class Function(object):
         self.argument_decls = []
         self.entrypoint = None
         self.local_decls = {}
-        self.blocks = {}
+        self._blocks = {}
+        self._block_orders = {}
         self.externals = {}
 
+    def get_blocks(self):
+        return self._blocks
+    def set_blocks(self, b):
+        self._blocks = b
+        self.invalidate_block_order()
+    blocks = property(get_blocks, set_blocks)
+
+    def invalidate_block_order(self):
+        """
+        Discards the cached block orderings and complexity.  Replacing
+        self.blocks does this automatically; changing it (or any block's
+        edges) in place does not.
+        """
+        self._block_orders = {}
+
     def fndecl_to_c(self):
         return '%s %s(%s)' % \
             ( self.return_type.to_c(), 
@@ -62,10 +81,12 @@ class Function(object):
               self.blocks_to_c() )
 
     def for_every_statement(self, call):
+        """
+        Calls 'call' on every statement, dropping those for which
+        it returns True.
+        """
         for block in self.blocks.values():
-            for stmt in block.statements[:]:
-                if call(stmt):
-                    block.statements.remove(stmt)
+            block.statements = [stmt for stmt in block.statements if not call(stmt)]
     
     def collect_aggregate_decls(self, types):
         o = []
@@ -90,8 +111,57 @@ class Function(object):
         self.for_every_statement(lambda x: x.attach_decls(self.local_decls))
         self.for_every_statement(lambda x: x.attach_decls(self.externals))
         self.for_every_statement(lambda x: x.resolve_temporary_names())
+
+    def finalise(self, types, aggregate_decls = None):
+        """
+        Does the work of resolve_aggregates then resolve_temporary_names
+        in a single walk over the statements.  'aggregate_decls' is
+        collect_aggregate_decls(types), which callers finalising many
+        functions against the same types should compute once.
+        """
+        for l in self.local_decls.values():
+            l.resolve_aggregates(types)
+        for l in self.argument_decls:
+            l.resolve_aggregates(types)
+        for l in self.externals.values():
+            l.resolve_aggregates(types)
+        if aggregate_decls is None:
+            aggregate_decls = self.collect_aggregate_decls(types)
+        
+        # later maps win, as they did when attached one after another.
+        decls = dict(aggregate_decls)
+        decls.update((x.binding.id, x) for x in self.argument_decls)
+        decls.update(self.local_decls)
+        decls.update(self.externals)
+        
+        def finalise_statement(stmt):
+            stmt.attach_decls(decls)
+            stmt.resolve_aggregates(aggregate_decls)
+            return stmt.resolve_temporary_names()
+        
+        def profiled_statement(stmt):
+            mark = instrument.start('attach_decls', False)
+            stmt.attach_decls(decls)
+            instrument.stop(mark)
+            mark = instrument.start('resolve_aggregates', False)
+            stmt.resolve_aggregates(aggregate_decls)
+            instrument.stop(mark)
+            mark = instrument.start('resolve_temporary_names', False)
+            drop = stmt.resolve_temporary_names()
+            instrument.stop(mark)
+            return drop
+        
+        if instrument.active():
+            instrument.count('statements', self.count_expressions())
+            self.for_every_statement(profiled_statement)
+        else:
+            self.for_every_statement(finalise_statement)
     
     def cyclomatic_complexity(self):
+        # kept with the block orders: it goes stale when they do.
+        return self._block_order('complexity', self._cyclomatic_complexity)
+    
+    def _cyclomatic_complexity(self):
         e = self.count_edges()
         n = len(self.blocks)
         return e - n + 2
@@ -113,34 +183,76 @@ class Function(object):
         Returns a list of blocks in 'natural' order, ie
         the order they are likely to be visited during execution.
         """
-        out = []
-        worklist = []
-        visited = []
-        
-        def add(edge):
-            bb = self.blocks[edge]
-            if bb not in visited:
-                visited.append(bb)
-            else:
-                return
-            if bb not in out:
-                out.append(bb)
-            if bb not in worklist:
-                worklist.append(bb)
-        
-        # start at the start.
-        add(self.entrypoint)
+        return list(self._block_order('natural', self._natural_order))
+    
+    def blocks_in_postorder(self):
+        """
+        Returns a list of reachable blocks in depth-first postorder,
+        each block after all its successors (back edges aside).
+        """
+        return list(self._block_order('post', self._postorder))
+    
+    def blocks_in_reverse_postorder(self):
+        """
+        Returns a list of reachable blocks in reverse postorder, each
+        block before its successors (back edges aside).  This is the order
+        wanted by iterative dataflow and dominator computations.
+        """
+        return list(self._block_order('rpo', self._reverse_postorder))
+    
+    def _block_order(self, kind, compute):
+        order = self._block_orders.get(kind)
+        if order is None:
+            order = self._block_orders[kind] = compute()
+        return order
+    
+    def _natural_order(self):
+        # breadth first from the start.
+        start = self.blocks[self.entrypoint]
+        out = [start]
+        seen = set([self.entrypoint])
+        worklist = deque(out)
         
-        while len(worklist):
-            bb = worklist.pop(0)
+        while worklist:
+            bb = worklist.popleft()
             for edge in bb.get_edges():
-                add(edge)
+                if edge not in seen:
+                    seen.add(edge)
+                    next = self.blocks[edge]
+                    out.append(next)
+                    worklist.append(next)
         
         # last block (containing fake return) is last.
-        last = self.blocks[max(self.blocks.keys())]
-        out.remove(last)
-        out.append(last)
+        last = max(self.blocks.keys())
+        if last in seen:
+            out.remove(self.blocks[last])
+            out.append(self.blocks[last])
+        
+        return out
+    
+    def _postorder(self):
+        start = self.blocks[self.entrypoint]
+        out = []
+        seen = set([self.entrypoint])
+        stack = [(start, iter(start.get_edges()))]
         
+        while stack:
+            bb, edges = stack[-1]
+            for edge in edges:
+                if edge not in seen:
+                    seen.add(edge)
+                    next = self.blocks[edge]
+                    stack.append((next, iter(next.get_edges())))
+                    break
+            else:
+                stack.pop()
+                out.append(bb)
+        
+        return out
+    
+    def _reverse_postorder(self):
+        out = list(self._block_order('post', self._postorder))
+        out.reverse()
         return out
     
     def complexity_raw_lines(self):
@@ -167,7 +279,7 @@ class Function(object):
         assert e.tag == 'function'
         f.return_type = types.type_from_xml(descend_one(e.find('returns')))
         f.name = e.get('name')
-        f.location = Location(e.get('location'))
+        f.location = location(e.get('location'))
         f.body_bounds = Bounds(f.location.line, int(e.get('body-begin')), int(e.get('body-end')))
         for a in e.find('args').getchildren():
             f.argument_decls += [ decl.Decl.from_xml(a) ]
@@ -19,29 +19,154 @@
 
 import os.path
 from etree import etree
+from lighthouse.misc import in_scope
+import lighthouse.cache as unitcache
+import lighthouse.instrument as instrument
 import lighthouse.unit as unit
 import lighthouse.functions as functions
 import lighthouse.types as types
 
-def parse(fn, out = None):
+def parse(fn, out = None, cache = None):
     """
     Reads XML from the file name or object 'fn' and returns
     a 'Unit' instance.  Rewrites the XML to out, if not None.
+    
+    Units already seen are loaded from 'cache' (a UnitCache, by default
+    the one configured by LH_CACHE, if any); pass False to always decode
+    the XML.
     """
+    mark = instrument.start('parse')
+    try:
+        return _parse(fn, out, cache)
+    finally:
+        instrument.stop(mark)
+
+def _parse(fn, out, cache):
+    if cache is None:
+        cache = unitcache.default()
+    if out:
+        cache = None
+    
+    if cache:
+        return _parse_cached(fn, cache)
+    if not out:
+        return parse_incremental(fn)
+
     e = etree.parse(fn).getroot()
+    if out:
+        open(out + os.path.basename(e.get('filename')) + '.lh', 'w').write(etree.tostring(e))
+
+    u = decode(e)
+    u.finalise()
+    return u
+
+def decode(e):
+    """
+    Returns a 'Unit' built from 'e', the root element of a report.
+    The unit is not yet finalised: call its finalise() before use.
+    """
     u = unit.Unit()
     u.lang = e.get('language')
     u.filename = e.get('filename')
-    
-    if out:
-        open(out + os.path.basename(u.filename) + '.lh', 'w').write(etree.tostring(e))
-
     u.source = e.find('raw-source').text
+    scope = {}
     for t in e.find('referenced-types').getchildren():
-        tt = types.aggregate_from_xml(t)
+        tt = in_scope(scope, types.aggregate_from_xml, t)
         assert tt.id not in u.types
         u.types[tt.id] = tt
     for f in e.find('function-bodies').getchildren():
-        u.functions += [ functions.Function.from_xml(f) ]
-    u.finalise()
+        u.functions += [ in_scope(scope, functions.Function.from_xml, f) ]
     return u
+
+def _parse_cached(fn, cache):
+    if isinstance(fn, basestring):
+        digest = unitcache.digest_file(fn)
+    elif unitcache.seekable(fn):
+        start = fn.tell()
+        digest = unitcache.digest_stream(fn)
+        fn.seek(start)
+    else:
+        # eg. a pipe, which can only be read once: parse it as it is
+        # hashed, so it is never all in memory, and store the unit for
+        # the next time the same XML is seen.
+        h = unitcache.Hashing(fn)
+        u = parse_incremental(h)
+        cache.store(h.hexdigest(), u)
+        return u
+    
+    u = cache.load(digest)
+    if u is None:
+        u = parse_incremental(fn)
+        cache.store(digest, u)
+    else:
+        instrument.count('cache_hits')
+    return u
+
+def parse_incremental(fn, callback = None, keep = True):
+    """
+    Reads XML from the file name or object 'fn' without ever holding
+    the whole document, and returns a 'Unit' instance.
+    
+    If 'callback' is given it is called as callback(unit, function) for
+    each function as soon as it has been read and finalised.  If 'keep'
+    is false, functions are not retained in unit.functions.
+    """
+    u = unit.Unit()
+    for f in _iterparse(fn, u, keep):
+        if callback:
+            callback(u, f)
+    return u
+
+def iterparse(fn, keep = True):
+    """
+    Generator version of parse_incremental: yields (unit, function) pairs
+    in document order.  The unit is the same object each time, and has
+    its source and types filled in before the first function is yielded.
+    """
+    u = unit.Unit()
+    for f in _iterparse(fn, u, keep):
+        yield u, f
+
+def _iterparse(fn, u, keep):
+    """
+    Fills in 'u' from the XML in 'fn', generating each function as its
+    <function> element is closed.  Each subtree is discarded once it has
+    been converted, so the object model is all that stays resident.
+    """
+    depth = 0
+    bodies = None
+    types_done = False
+    scope = {} # shared values, for this unit only
+    
+    for event, e in etree.iterparse(fn, events = ('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                u.lang = e.get('language')
+                u.filename = e.get('filename')
+            elif depth == 2 and e.tag == 'function-bodies':
+                bodies = e
+            continue
+        
+        depth -= 1
+        if depth == 2 and bodies is not None and e.tag == 'function':
+            assert types_done, 'function bodies precede referenced types'
+            f = in_scope(scope, functions.Function.from_xml, e)
+            bodies.clear()
+            u.finalise_function(f)
+            if keep:
+                u.functions.append(f)
+            yield f
+        elif depth == 1:
+            if e.tag == 'raw-source':
+                u.source = e.text
+            elif e.tag == 'referenced-types':
+                for t in e.getchildren():
+                    tt = in_scope(scope, types.aggregate_from_xml, t)
+                    assert tt.id not in u.types
+                    u.types[tt.id] = tt
+                u.finalise_types()
+                types_done = True
+            elif e.tag == 'function-bodies':
+                bodies = None
+            e.clear()
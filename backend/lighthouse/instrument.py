@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - opt-in profiling of the back-end.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Records where the time goes while a unit is parsed and analysed.
+
+Profiling is off unless the LH_PROFILE environment variable is set (to
+'-' for stderr, or the name of a file to append to), or enable() is
+called.  While it is on, the drivers (lh-pipe, lh-daemon and lh-batch)
+bracket each unit with begin_unit() and end_unit(), and the code in
+between records phases:
+
+  parse                     lighthouse.input.parse
+  finalise_types            Unit.finalise_types
+  finalise                  Unit.finalise_function
+  attach_decls              } each statement, within finalise
+  resolve_aggregates        }
+  resolve_temporary_names   }
+  check_unit:<class>        each analyser
+  handler:<class>.<name>    each FunctionCallAnalyser handler
+  warn                      building and emitting diagnostics
+
+Phases nest, and the time of each includes any phases inside it.  For
+each phase the number of calls, wall and CPU seconds are kept, and for
+those not run per statement or call, the growth in resident set (KB).
+Counters record the functions, statements, calls and diagnostics
+processed.
+
+end_unit() writes a summary of the unit as one line of JSON; lh-batch
+also writes the totals over all its units.
+"""
+
+import os, sys, time, json, resource
+
+PROFILE_ENV = 'LH_PROFILE'
+
+g_enabled = False
+g_output = None  # file name, file object, or None to only return summaries
+g_file = None    # the file opened for g_output
+g_profile = None # of the unit under way
+
+PAGE_KB = resource.getpagesize() / 1024
+
+def rss():
+    """
+    Current resident set size in KB, or None if it cannot be read.
+    """
+    try:
+        pages = int(open('/proc/self/statm').read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return pages * PAGE_KB
+
+class Profile(object):
+    """
+    The phases and counters of one unit.
+    """
+    def __init__(self):
+        self.phases = {} # name -> [calls, wall, cpu, rss or None]
+        self.counters = {}
+        self.wall = time.time()
+        self.cpu = time.clock()
+
+    def add(self, name, wall, cpu, grew = None):
+        p = self.phases.get(name)
+        if p is None:
+            p = self.phases[name] = [0, 0.0, 0.0, None]
+        p[0] += 1
+        p[1] += wall
+        p[2] += cpu
+        if grew is not None:
+            p[3] = (p[3] or 0) + grew
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self, unit = None):
+        phases = {}
+        for name, (calls, wall, cpu, grew) in self.phases.iteritems():
+            phases[name] = dict(calls = calls, wall = round(wall, 6), cpu = round(cpu, 6))
+            if grew is not None:
+                phases[name]['rss'] = grew
+        return dict(unit = unit and unit.filename or None,
+                    wall = round(time.time() - self.wall, 6),
+                    cpu = round(time.clock() - self.cpu, 6),
+                    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    phases = phases,
+                    counters = dict(self.counters))
+
+class Totals(object):
+    """
+    Sums unit summaries, eg. over a batch.
+    """
+    def __init__(self):
+        self.units = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.maxrss = 0
+        self.phases = {}
+        self.counters = {}
+
+    def add(self, summary):
+        self.units += 1
+        self.wall += summary['wall']
+        self.cpu += summary['cpu']
+        self.maxrss = max(self.maxrss, summary['maxrss'])
+        for name, p in summary['phases'].iteritems():
+            t = self.phases.setdefault(name, dict(calls = 0, wall = 0.0, cpu = 0.0))
+            t['calls'] += p['calls']
+            t['wall'] += p['wall']
+            t['cpu'] += p['cpu']
+            if 'rss' in p:
+                t['rss'] = t.get('rss', 0) + p['rss']
+        for name, n in summary['counters'].iteritems():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        phases = {}
+        for name, p in self.phases.iteritems():
+            phases[name] = dict(p, wall = round(p['wall'], 6), cpu = round(p['cpu'], 6))
+        return dict(units = self.units,
+                    wall = round(self.wall, 6), cpu = round(self.cpu, 6),
+                    maxrss = self.maxrss,
+                    phases = phases, counters = dict(self.counters))
+
+# --- switching it on.
+def enable(output = None):
+    """
+    Turns profiling on.  Summaries are written to 'output', a file name
+    or object ('-' is stderr), or if it is None only returned by
+    end_unit().
+    """
+    global g_enabled, g_output, g_file
+    g_enabled = True
+    if g_file is not None and isinstance(g_output, basestring) and g_output != '-':
+        g_file.close()
+    g_output, g_file = output, None
+
+def disable():
+    global g_enabled, g_profile
+    enable(None)
+    g_enabled = False
+    g_profile = None
+
+def enabled():
+    return g_enabled
+
+def active():
+    """
+    True if a unit is being profiled.
+    """
+    return g_profile is not None
+
+def emit(summary):
+    """
+    Writes 'summary' as a line of JSON to the configured output.
+    """
+    global g_file
+    if g_output is None:
+        return
+    if g_file is None:
+        if g_output == '-':
+            g_file = sys.stderr
+        elif isinstance(g_output, basestring):
+            g_file = open(g_output, 'a')
+        else:
+            g_file = g_output
+    g_file.write(json.dumps(summary, sort_keys = True) + '\n')
+    g_file.flush()
+
+# --- recording.
+def begin_unit():
+    """
+    Starts profiling a unit, if profiling is on.
+    """
+    global g_profile
+    if g_enabled:
+        g_profile = Profile()
+
+def end_unit(unit = None, write = True):
+    """
+    Finishes profiling 'unit', returning its summary (or None if
+    profiling is off).  The summary is also written out, if 'write'.
+    """
+    global g_profile
+    if g_profile is None:
+        return None
+    summary = g_profile.summary(unit)
+    g_profile = None
+    if write:
+        emit(summary)
+    return summary
+
+def start(name, memory = True):
+    """
+    Returns a mark for stop(), or None if no unit is being profiled.
+    Resident set growth is only measured if 'memory': reading it costs
+    more than the phases run per statement or call take.
+    """
+    if g_profile is None:
+        return None
+    return (name, time.time(), time.clock(), memory and rss() or None)
+
+def stop(mark):
+    """
+    Adds the time since start() returned 'mark' to its phase.
+    """
+    if mark is None or g_profile is None:
+        return
+    name, wall, cpu, before = mark
+    grew = None
+    if before is not None:
+        now = rss()
+        if now is not None:
+            grew = now - before
+    g_profile.add(name, time.time() - wall, time.clock() - cpu, grew)
+
+def count(name, n = 1):
+    if g_profile is not None:
+        g_profile.count(name, n)
+
+def _configure():
+    where = os.environ.get(PROFILE_ENV, '')
+    if where not in ('', 'off'):
+        enable(where)
+
+_configure()
@@ -17,9 +17,18 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import threading
+from collections import OrderedDict
+from array import array
 from etree import etree 
 
 class Location(object):
+    """
+    A place in the source.  Use location() to make these while reading a
+    unit, and treat them as immutable: equal locations may be shared.
+    """
+    __slots__ = ('file', 'line', 'column')
+
     def __init__(self, loc):
         self.set(loc)
     
@@ -34,6 +43,8 @@ class Location(object):
         if len(bits) in (2, 3):
             self.line = int(bits[1])
             self.file = bits[0]
+            if isinstance(self.file, str):
+                self.file = intern(self.file)
         if len(bits) == 3:
             self.column = int(bits[2])
         else:
@@ -46,14 +57,20 @@ class Location(object):
                 (self.file, self.line, self.column)
     
     def highlight(self, src, label = ''):
-        x = max(0, self.line - 1 - 2)
-        y = self.line - 1 + 2
-        actual_lines = src.splitlines()
+        """
+        Returns the lines of 'src' around this location.  'src' is the
+        source text, or its LineIndex.
+        """
+        if isinstance(src, basestring):
+            actual_lines = LineIndex(src)
+        else:
+            actual_lines = src
 
         selected_lines = []
         context = 5
 
-        for l in range(max(0, self.line - 1 - context), self.line + context):
+        for l in range(max(0, self.line - 1 - context),
+                       min(len(actual_lines), self.line + context)):
             if l == self.line - 1:
                 selected_lines.append('>>> %-4d ' % (l+1)  + actual_lines[l])
                 if self.column:
@@ -63,6 +80,217 @@ class Location(object):
         
         return '\n'.join(selected_lines)
 
+g_scope = threading.local()
+
+def in_scope(scope, fn, *args):
+    """
+    Calls fn(*args) with the dict 'scope' as this thread's interning
+    scope, so that values interned meanwhile are shared with everything
+    else made in that scope.  Readers keep one scope per unit.
+    """
+    old = getattr(g_scope, 'current', None)
+    g_scope.current = scope
+    try:
+        return fn(*args)
+    finally:
+        g_scope.current = old
+
+def interned(kind, key, make):
+    """
+    Returns the value of kind 'kind' for 'key' in the current scope,
+    calling make(key) the first time.  Outside any scope, always calls
+    make(key).
+    """
+    scope = getattr(g_scope, 'current', None)
+    if scope is None:
+        return make(key)
+    table = scope.get(kind)
+    if table is None:
+        table = scope[kind] = {}
+    value = table.get(key)
+    if value is None:
+        value = table[key] = make(key)
+    return value
+
+def location(loc):
+    """
+    Returns a Location for the string 'loc', interned in the current scope.
+    """
+    return interned(Location, loc, Location)
+
+# --- sections which must not be interrupted.
+g_critical = threading.local()
+
+def enter_critical():
+    """
+    Starts a section of code which an asynchronous exception (such as
+    analysis.BudgetExceeded, raised from a signal handler) must not
+    interrupt.  Sections nest, per thread.
+    """
+    g_critical.depth = getattr(g_critical, 'depth', 0) + 1
+
+def leave_critical():
+    """
+    Ends a section started by enter_critical(), raising any exception
+    deferred while it ran.
+    """
+    g_critical.depth -= 1
+    if g_critical.depth == 0:
+        pending = getattr(g_critical, 'pending', None)
+        if pending is not None:
+            g_critical.pending = None
+            raise pending
+
+def in_critical():
+    return getattr(g_critical, 'depth', 0) > 0
+
+def defer(exc):
+    """
+    Arranges for 'exc' to be raised when the current critical section ends.
+    """
+    g_critical.pending = exc
+
+class LRU(object):
+    """
+    A mapping of at most 'size' items, which forgets the least recently
+    used item to make room.  Safe to share between threads, and each
+    operation is a critical section, so it is never left locked or
+    inconsistent by an asynchronous exception.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default = None):
+        enter_critical()
+        try:
+            self.lock.acquire()
+            try:
+                try:
+                    value = self.items.pop(key)
+                except KeyError:
+                    self.misses += 1
+                    return default
+                self.items[key] = value
+                self.hits += 1
+                return value
+            finally:
+                self.lock.release()
+        finally:
+            leave_critical()
+
+    def __setitem__(self, key, value):
+        enter_critical()
+        try:
+            self.lock.acquire()
+            try:
+                self.items.pop(key, None)
+                self.items[key] = value
+                while len(self.items) > self.size:
+                    self.items.popitem(last = False)
+            finally:
+                self.lock.release()
+        finally:
+            leave_critical()
+
+    def pop(self, key, default = None):
+        enter_critical()
+        try:
+            self.lock.acquire()
+            try:
+                return self.items.pop(key, default)
+            finally:
+                self.lock.release()
+        finally:
+            leave_critical()
+
+    def clear(self):
+        enter_critical()
+        try:
+            self.lock.acquire()
+            try:
+                self.items.clear()
+            finally:
+                self.lock.release()
+        finally:
+            leave_critical()
+
+def _offset_type(n):
+    """
+    Returns the smallest unsigned array typecode which holds offsets up
+    to 'n' ('I' is 32 bits, 'L' 64 on LP64 platforms).
+    """
+    for typecode in ('I', 'L'):
+        if n < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    raise OverflowError('%d bytes of text is too long to index' % n)
+
+class LineIndex(object):
+    """
+    The offsets at which each line of 'text' starts, so single lines can be
+    sliced out without splitting the whole text.  Indexing gives the line
+    (from 0) without its line ending.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.starts = array(_offset_type(len(text)), [0])
+        find = text.find
+        i = find('\n')
+        while i != -1:
+            self.starts.append(i + 1)
+            i = find('\n', i + 1)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        start, end = self.span(i)
+        return self.text[start:end]
+
+    def __iter__(self):
+        for i in xrange(len(self.starts)):
+            yield self[i]
+
+    def span(self, i):
+        """
+        Returns the (start, end) offsets of line 'i' (from 0), excluding
+        its line ending.
+        """
+        start = self.starts[i]
+        if i + 1 < len(self.starts):
+            end = self.starts[i + 1] - 1
+            if end > start and self.text[end - 1] == '\r':
+                end -= 1
+        else:
+            end = len(self.text)
+        return start, end
+
+    def offset(self, line, column = 1):
+        """
+        Returns the offset of 'line' and 'column' (both from 1, as in
+        a Location).
+        """
+        return self.starts[line - 1] + max(column, 1) - 1
+
+    def columns(self, line, first, last = None):
+        """
+        Returns columns 'first' to 'last' inclusive (from 1) of 'line'
+        (from 1), or to the end of the line if 'last' is None.
+        """
+        start, end = self.span(line - 1)
+        if last is not None:
+            end = min(end, start + last)
+        return self.text[start + first - 1:end]
+
 def descend_one(t):
     """
     descend into t's single child element.
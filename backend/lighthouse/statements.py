@@ -17,13 +17,16 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+from bisect import bisect_right
 import lighthouse.types as types
 import lighthouse.decl as decl
 import lighthouse.expression as expression
 import lighthouse.constant as constant
-from lighthouse.misc import descend_one, to_c, Location
+from lighthouse.misc import descend_one, to_c, location
 
 class Statement(object):
+    __slots__ = ('location',)
+
     def __init__(self):
         self.location = None
 
@@ -44,6 +47,8 @@ class Statement(object):
         return []
 
 class Assignment(Statement):
+    __slots__ = ('lhs', 'rhs')
+
     def __init__(self):
         Statement.__init__(self)
         self.lhs = None
@@ -74,13 +79,15 @@ class Assignment(Statement):
     def from_xml(t):
         a = Assignment()
         if t.get('location'):
-            a.location = Location(t.get('location'))
+            a.location = location(t.get('location'))
         a.lhs = expression.result_from_xml(descend_one(t.find('lhs')))
         for x in t.find('rhs').getchildren():
           a.rhs += [expression.expression_from_xml(x)]
         return a
 
 class Cond(Statement):
+    __slots__ = ('cond', 'then', 'else_')
+
     def __init__(self):
         Statement.__init__(self)
         self.cond = []
@@ -104,7 +111,7 @@ class Cond(Statement):
     def from_xml(t):
         c = Cond()
         if t.get('location'):
-            c.location = Location(t.get('location'))
+            c.location = location(t.get('location'))
         for x in t.getchildren():
             if x.tag == 'then':
                 c.then = int(x.get('id'))
@@ -115,6 +122,8 @@ class Cond(Statement):
         return c
 
 class Call(Statement):
+    __slots__ = ('fnexpr', 'lhs', 'args')
+
     def __init__(self):
         Statement.__init__(self)
         self.fnexpr = None
@@ -137,7 +146,7 @@ class Call(Statement):
     def from_xml(t):
         c = Call()
         if t.get('location'):
-            c.location = Location(t.get('location'))
+            c.location = location(t.get('location'))
         
         if t.find('function') == None:
           c.fnexpr = expression.expression_from_xml(t.getchildren()[0])
@@ -150,6 +159,8 @@ class Call(Statement):
         return c
 
 class Ret(Statement):
+    __slots__ = ('expr',)
+
     def __init__(self):
         Statement.__init__(self)
         self.expr = None
@@ -168,24 +179,73 @@ class Ret(Statement):
     def from_xml(t):
         r = Ret()
         if t.get('location'):
-            r.location = Location(t.get('location'))
+            r.location = location(t.get('location'))
         if t.getchildren():
             r.expr = expression.expression_from_xml(descend_one(t))
         return r
 
+class CaseRange(object):
+    """
+    Switch case sending values 'low' to 'high' inclusive to block 'target'.
+    An exact case has low == high.
+    """
+    __slots__ = ('low', 'high', 'target')
+
+    def __init__(self, low, high, target):
+        self.low, self.high, self.target = low, high, target
+
+    def __repr__(self):
+        return '<case %s to bb%d>' % (self.label(), self.target)
+
+    def label(self):
+        if self.low == self.high:
+            return str(self.low)
+        else:
+            return '%d ... %d' % (self.low, self.high)
+
 class Switch(Statement):
+    __slots__ = ('expr', 'default', 'cases', '_lows')
+
     def __init__(self):
         Statement.__init__(self)
         self.expr = None
         self.default = None
-        self.mapping = {}
+        self.set_cases([])
+    
+    def set_cases(self, cases):
+        """
+        Sets the list of CaseRanges, which must not overlap.
+        """
+        self.cases = sorted(cases, key = lambda c: c.low)
+        self._lows = [c.low for c in self.cases]
+    
+    def lookup(self, value):
+        """
+        Returns the block 'value' switches to.
+        """
+        i = bisect_right(self._lows, value) - 1
+        if i >= 0 and value <= self.cases[i].high:
+            return self.cases[i].target
+        return self.default
+    
+    def targets(self):
+        """
+        Returns the blocks the cases go to, each once, in case order.
+        """
+        out = []
+        seen = set()
+        for c in self.cases:
+            if c.target not in seen:
+                seen.add(c.target)
+                out.append(c.target)
+        return out
     
     def to_c(self):
       expr = 'switch (%s)' % (self.expr.to_c())
 
       cases = []
-      for v, b in self.mapping.iteritems():
-          cases.append('  case %s: goto bb%d;' % (str(v), b))
+      for c in self.cases:
+          cases.append('  case %s: goto bb%d;' % (c.label(), c.target))
       if self.default:
           cases.append('  default: goto bb%d;' % (self.default))
       cases = '\n'.join(cases)
@@ -196,46 +256,45 @@ class Switch(Statement):
         expression.attach_decls_to_bindings(decls, self.expr)
     
     def get_edges(self):
-        out = list(self.mapping.values())
-        if self.default: out.append(self.default)
+        out = self.targets()
+        if self.default and self.default not in out: out.append(self.default)
         return out
 
     @staticmethod
     def from_xml(t):
         s = Switch()
         if t.get('location'):
-            s.location = Location(t.get('location'))
+            s.location = location(t.get('location'))
         s.expr = expression.expression_from_xml(descend_one(t.find('index')))
         if t.find('default') is not None:
           s.default = int(t.find('default').get('id'))
+        cases = []
         for c in t.findall('case'):
           if len(c.getchildren()) == 1:
             k = descend_one(c)
             assert k.tag == 'exact', 'strange case label'
-            s.mapping[constant.convert(descend_one(k))] = int(c.get('id'))
+            low_const = high_const = constant.convert(descend_one(k)).get_value()
           else:
             assert len(c.getchildren()) == 2, 'strange case label'
             low, high = c.getchildren()
             assert low.tag == 'low-bound'
             assert high.tag == 'high-bound'
             low_const, high_const = constant.convert(descend_one(low)).get_value(), constant.convert(descend_one(high)).get_value()
-            for x in range(low_const, high_const + 1):
-                s.mapping[x] = int(c.get('id'))
+          cases.append(CaseRange(int(low_const), int(high_const), int(c.get('id'))))
+        s.set_cases(cases)
         return s
 
+statement_kinds = {
+  'assign': Assignment.from_xml,
+  'if': Cond.from_xml,
+  'call': Call.from_xml,
+  'switch': Switch.from_xml,
+  'return': Ret.from_xml,
+  'exception-dispatch': lambda t: None, # ignored
+}
+
 def statement_from_xml(t):
-    kinds = {
-      'assign': Assignment,
-      'if': Cond,
-      'call': Call,
-      'switch': Switch,
-      'return': Ret,
-    }
-    
-    ignore = set(['exception-dispatch'])
-    if t.tag in ignore:
-        return None
-    
-    assert t.tag in kinds, 'unknown type ' + t.tag
-    return kinds[t.tag].from_xml(t)
+    make = statement_kinds.get(t.tag)
+    assert make is not None, 'unknown type ' + t.tag
+    return make(t)
     
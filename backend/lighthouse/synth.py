@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+#
+# Lighthouse - synthetic translation units.
+# Copyright (C) 2009  Joseph Birr-Pixton
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Writes <lh-translation-unit> XML in the form the gcc plugin produces,
+without needing gcc, for testing the back-end at scale.  The output
+depends only on the parameters and the seed:
+
+ - functions: number of function bodies, or
+ - size: bytes of output to write (at least one function is written);
+ - blocks: basic blocks per function;
+ - shape: how blocks end ('linear', 'diamond', 'loop', 'switch', or
+   a random 'mixed' of them);
+ - switch_width: cases per switch;
+ - types, type_depth: aggregate types, in chains of pointers this long.
+   Each block reads through a chain from the 'sp' argument;
+ - calls, handlers: calls per block, to functions picked from
+   'handlers'.  Calls to the D3S functions get a well formed format
+   string and matching arguments; others get two ints;
+ - statements: arithmetic assignments per block.
+
+Function bodies and source lines are spooled to temporary files, so the
+memory used does not depend on the size of the output.
+"""
+
+import random, tempfile, shutil
+from xml.sax.saxutils import escape
+
+SHAPES = ('linear', 'diamond', 'loop', 'switch', 'mixed')
+
+# functions with a D3S checker handler: the index of their format
+# argument, and whether the arguments are pointers.
+D3S_CALLS = {
+    'dsPackListB': (2, False),
+    'dsPackMapB': (2, False),
+    'dsMakeListB': (1, False),
+    'dsMakeMapB': (1, False),
+    'dsUnpackList': (3, True),
+}
+
+D3S_SPECS = (
+    ('i(8)', 'int8_t'), ('i(16)', 'int16_t'), ('i(32)', 'int32_t'),
+    ('v(8)', 'uint8_t'), ('v(32)', 'uint32_t'), ('i', 'int'),
+    ('v', 'unsigned int'), ('j', 'size_t'),
+)
+
+INTEGERS = {
+    'int8_t': (8, False), 'int16_t': (16, False), 'int32_t': (32, False),
+    'uint8_t': (8, True), 'uint32_t': (32, True), 'int': (32, False),
+    'unsigned int': (32, True), 'size_t': (64, True),
+}
+
+DEFAULTS = dict(functions = 10, size = None, blocks = 8, shape = 'mixed',
+                switch_width = 8, types = 4, type_depth = 2, calls = 2,
+                handlers = tuple(sorted(D3S_CALLS)), statements = 3,
+                seed = 0, filename = 'synth.c')
+
+SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+def parse_size(s):
+    """
+    Returns the number of bytes in eg. '512', '64K', '2G'.
+    """
+    s = s.strip().lower()
+    if s and s[-1] in SUFFIXES:
+        return int(float(s[:-1]) * SUFFIXES[s[-1]])
+    return int(s)
+
+class Generator(object):
+    """
+    Writes a single translation unit.
+    """
+    def __init__(self, **params):
+        for k in params:
+            assert k in DEFAULTS, 'unknown parameter ' + k
+        self.__dict__.update(DEFAULTS)
+        self.__dict__.update(params)
+        assert self.shape in SHAPES, 'unknown shape ' + self.shape
+        assert self.blocks >= 1
+        assert self.switch_width >= 1 and self.type_depth >= 1
+        assert self.handlers or not self.calls, 'calls need handlers'
+
+        self.rand = random.Random(self.seed)
+        self.uid = 1000
+        self.line = 1
+        self.source = None
+        self.types_written = 0
+        self.chain = [] # (type id, next member id or None, int member id)
+        self.function_ids = {}
+
+    def next_uid(self):
+        self.uid += 1
+        return self.uid
+
+    def src(self, text, col = 3):
+        """
+        Adds a line of source, returning its location.
+        """
+        loc = '%s:%d:%d' % (self.filename, self.line, col)
+        self.source.write(escape(text) + '\n')
+        self.line += 1
+        return loc
+
+    # --- types
+    def integer(self, name = 'int', precision = 32, unsigned = False):
+        return "<integer name='%s'%s precision='%d' />" % \
+            (name, unsigned and " unsigned='1'" or '', precision)
+
+    def named_integer(self, cname):
+        precision, unsigned = INTEGERS[cname]
+        return self.integer(cname, precision, unsigned)
+
+    def pointer_to(self, id):
+        return "<addr-of><structure id='%d' /></addr-of>" % id
+
+    def aggregate_types(self, out):
+        """
+        Each type points to itself and, except at the end of a chain,
+        to the next type.
+        """
+        ids = [self.next_uid() for i in range(self.types)]
+        for i, id in enumerate(ids):
+            self.src('struct s%d {' % id)
+            to = None
+            if i + 1 < len(ids) and (i + 1) % self.type_depth != 0:
+                to = ids[i + 1]
+            nxt, mids, members = None, [], []
+            for m in range(3):
+                mid = self.next_uid()
+                mids.append(mid)
+                if m == 0 and to:
+                    loc = self.src('  struct s%d *m%d;' % (to, mid))
+                    t = self.pointer_to(to)
+                    nxt = mid
+                elif m == 1:
+                    loc = self.src('  struct s%d *m%d;' % (id, mid))
+                    t = self.pointer_to(id)
+                else:
+                    loc = self.src('  int m%d;' % mid)
+                    t = self.integer()
+                members.append("<member location='%s'><binding id='%d' name='m%d' />"
+                               "<type size='32' alignment='32'>%s</type></member>" % \
+                               (loc, mid, mid, t))
+            self.src('};')
+            s = "<structure id='%d' name='s%d'>%s</structure>\n" % \
+                (id, id, ''.join(members))
+            out.write(s)
+            self.types_written += len(s)
+            if i < self.type_depth:
+                self.chain.append((id, nxt, mids[2]))
+
+    # --- expressions
+    def constant_int(self, v):
+        return "<constant>%s<integer-literal value='%d' /></constant>" % \
+            (self.integer(), v)
+
+    def string_literal(self, s):
+        return "<addr-of><item-ref><array><constant>" \
+            "<array id='%d'><type><integer name='char' precision='8' /></type>" \
+            "<domain><integer precision='64' min='0' max='%d' /></domain></array>" \
+            "<string-literal>%s\\x00</string-literal></constant></array>" \
+            "<index>%s</index></item-ref></addr-of>" % \
+            (self.next_uid(), len(s), escape(s), self.constant_int(0))
+
+    def member_chain(self, sp):
+        """
+        Returns the C and XML for reading the int at the end of the
+        chain of types starting at sp's.
+        """
+        c = 'sp'
+        xml = "<bound-parameter id='%d' />" % sp
+        for id, nxt, last in self.chain:
+            mid = nxt or last
+            c = '%s->m%d' % (c, mid)
+            xml = "<member-ref><structure><indirection>%s</indirection></structure>" \
+                  "<member><bound id='%d' /></member></member-ref>" % (xml, mid)
+            if not nxt:
+                break
+        return c, xml
+
+    # --- statements
+    def call(self, x, y, vlocals):
+        fname = self.rand.choice(self.handlers)
+        if fname not in self.function_ids:
+            self.function_ids[fname] = self.next_uid()
+
+        if fname in D3S_CALLS:
+            fmtidx, unpack = D3S_CALLS[fname]
+            picks = [self.rand.randint(0, len(D3S_SPECS) - 1)
+                     for i in range(self.rand.randint(1, 4))]
+            fmt = ''.join([D3S_SPECS[i][0] for i in picks])
+            args = [self.constant_int(0)] * fmtidx + [self.string_literal(fmt)]
+            for i in picks:
+                if unpack:
+                    args.append("<addr-of><bound id='%d' /></addr-of>" % vlocals[i])
+                else:
+                    args.append("<bound id='%d' />" % vlocals[i])
+            loc = self.src('  %s(%s"%s", ...);' % (fname, '0, ' * fmtidx, fmt))
+        else:
+            args = ["<bound id='%d' />" % x, "<bound id='%d' />" % y]
+            loc = self.src('  %s(x, y);' % fname)
+        return "<call location='%s'><function name='%s' id='%d' />" \
+               "<lhs><void /></lhs><args>%s</args></call>" % \
+               (loc, fname, self.function_ids[fname], ''.join(args))
+
+    def edges(self, ids, i):
+        """
+        Returns how block ids[i] ends: (kind, targets).
+        """
+        last = len(ids) - 1
+        if i == last:
+            return 'return', []
+        shape = self.shape
+        if shape == 'mixed':
+            shape = self.rand.choice(SHAPES[:-1])
+        if shape == 'linear':
+            return 'next', [ids[i + 1]]
+        if shape == 'diamond':
+            return 'if', [ids[i + 1], ids[min(last, i + 2)]]
+        if shape == 'loop':
+            return 'if', [ids[self.rand.randint(0, i)], ids[i + 1]]
+        return 'switch', [ids[min(last, i + 1 + self.rand.randint(0, 3))]
+                          for c in range(self.switch_width)]
+
+    def block(self, ids, i, sp, x, y, tmp, vlocals):
+        stmts = []
+        for s in range(self.statements):
+            loc = self.src('  x = y + %d;' % s)
+            stmts.append("<assign location='%s'><lhs><bound id='%d' /></lhs>"
+                         "<rhs><bound id='%d' /><plus />%s</rhs></assign>" % \
+                         (loc, x, y, self.constant_int(s)))
+        loc = self.src('  y = %d;' % i)
+        stmts.append("<assign location='%s'><lhs><bound id='%d' /></lhs>"
+                     "<rhs>%s</rhs></assign>" % (loc, tmp, self.constant_int(i)))
+        stmts.append("<assign location='%s'><lhs><bound id='%d' /></lhs>"
+                     "<rhs><bound id='%d' /></rhs></assign>" % (loc, y, tmp))
+        if self.chain:
+            c, xml = self.member_chain(sp)
+            loc = self.src('  x = %s;' % c)
+            stmts.append("<assign location='%s'><lhs><bound id='%d' /></lhs>"
+                         "<rhs>%s</rhs></assign>" % (loc, x, xml))
+        for c in range(self.calls):
+            stmts.append(self.call(x, y, vlocals))
+
+        kind, targets = self.edges(ids, i)
+        if kind == 'return':
+            loc = self.src('  return x;')
+            stmts.append("<return location='%s'><bound id='%d' /></return>" % (loc, x))
+        elif kind == 'next':
+            stmts.append("<next id='%d' />" % targets[0])
+        elif kind == 'if':
+            loc = self.src('  if (x < y) goto <bb %d>; else goto <bb %d>;' % tuple(targets))
+            stmts.append("<if location='%s'><bound id='%d' /><less-than /><bound id='%d' />"
+                         "<then id='%d' /><else id='%d' /></if>" % \
+                         (loc, x, y, targets[0], targets[1]))
+        else:
+            loc = self.src('  switch (x) { ... }')
+            cases = ["<case id='%d' location='%s'><exact>%s</exact></case>" % \
+                     (t, loc, self.constant_int(v)) for v, t in enumerate(targets)]
+            stmts.append("<switch location='%s'><index><bound id='%d' /></index>"
+                         "<default id='%d' />%s</switch>" % \
+                         (loc, x, ids[-1], ''.join(cases)))
+        return "<block id='%d'>%s</block>\n" % (ids[i], ''.join(stmts))
+
+    def function(self, index, out):
+        name = 'fn%d' % index
+        self.src('')
+        st = self.chain and self.chain[0][0] or None
+        fnloc = self.src('int %s(int a, %s *sp)' % (name, st and 'struct s%d' % st or 'int'), 1)
+        begin = self.line - 1
+        self.src('{')
+
+        a, sp = self.next_uid(), self.next_uid()
+        x, y, tmp = self.next_uid(), self.next_uid(), self.next_uid()
+        vlocals = [self.next_uid() for s in D3S_SPECS]
+
+        loc = self.src('  int x, y;')
+        locs = ["<local location='%s'><binding id='%d' name='x' /><type>%s</type></local>" % (loc, x, self.integer()),
+                "<local location='%s'><binding id='%d' name='y' /><type>%s</type></local>" % (loc, y, self.integer()),
+                "<local><binding id='%d' /><type>%s</type></local>" % (tmp, self.integer())]
+        for id, (spec, ct) in zip(vlocals, D3S_SPECS):
+            loc = self.src('  %s v%d;' % (ct, id))
+            locs.append("<local location='%s'><binding id='%d' name='v%d' /><type>%s</type></local>" % \
+                        (loc, id, id, self.named_integer(ct)))
+
+        ids = range(2, 2 + self.blocks)
+        blocks = [self.block(ids, i, sp, x, y, tmp, vlocals) for i in range(len(ids))]
+        self.src('}')
+        end = self.line - 1
+
+        externals = ["<external location='%s:1:1'><binding id='%d' name='%s' />"
+                     "<type><function><return>%s</return><arguments varargs='1' >"
+                     "</arguments></function></type></external>" % \
+                     (self.filename, id, fname, self.integer())
+                     for fname, id in sorted(self.function_ids.items())]
+
+        spt = st and self.pointer_to(st) or "<addr-of>%s</addr-of>" % self.integer()
+        out.write("<function name='%s' location='%s' body-begin='%d' body-end='%d'>\n"
+                  "<returns>%s</returns>\n"
+                  "<args><arg location='%s'><binding id='%d' name='a' /><type>%s</type></arg>"
+                  "<arg location='%s'><binding id='%d' name='sp' /><type>%s</type></arg></args>\n"
+                  "<body entrypoint='%d'>\n<locals>%s</locals>\n%s</body>\n"
+                  "<externals>%s</externals>\n</function>\n" % \
+                  (name, fnloc, begin, end, self.integer(),
+                   fnloc, a, self.integer(), fnloc, sp, spt,
+                   ids[0], ''.join(locs), ''.join(blocks), ''.join(externals)))
+
+    def more(self, index, written):
+        if self.size is None:
+            return index < self.functions
+        return index == 0 or written < self.size
+
+    def write(self, out):
+        head = "<?xml version='1.0' encoding='UTF-8'?>\n\n" \
+               "<lh-translation-unit filename='%s' language='C' client-version='0.1'>\n" \
+               "  <raw-source>" % self.filename
+        middle = "</raw-source>\n  <referenced-types>\n"
+        tail = "  </referenced-types>\n  <function-bodies>\n"
+        end = "  </function-bodies>\n</lh-translation-unit>\n"
+        fixed = len(head) + len(middle) + len(tail) + len(end)
+
+        self.source = tempfile.TemporaryFile()
+        types = tempfile.TemporaryFile()
+        bodies = tempfile.TemporaryFile()
+        try:
+            self.aggregate_types(types)
+            i = 0
+            while self.more(i, fixed + self.source.tell() + self.types_written + bodies.tell()):
+                self.function(i, bodies)
+                i += 1
+
+            out.write(head)
+            for f, between in ((self.source, middle), (types, tail), (bodies, end)):
+                f.seek(0)
+                shutil.copyfileobj(f, out)
+                out.write(between)
+        finally:
+            for f in (self.source, types, bodies):
+                f.close()
+            self.source = None
+
+def generate(out, **params):
+    """
+    Writes a unit with the given parameters (see DEFAULTS) to the file
+    object or file name 'out'.
+    """
+    if isinstance(out, basestring):
+        f = open(out, 'wb')
+        try:
+            Generator(**params).write(f)
+        finally:
+            f.close()
+    else:
+        Generator(**params).write(out)
@@ -17,8 +17,35 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import threading
 from lighthouse.decl import Decl
-from lighthouse.misc import descend_one
+from lighthouse.misc import descend_one, interned, LRU
+
+COMPARE_CACHE_SIZE = 4096
+
+class Generation(object):
+    """
+    What the types of one unit share: a count, bumped whenever an
+    aggregate reference inside one of them is replaced (which can change
+    the spelling of, and comparisons involving, any type containing it),
+    and the cache of their comparisons.  Spellings and
+    comparisons cached in an older generation are recomputed.
+
+    Types made outside a unit's scope each have their own, so resolving
+    one unit never invalidates another's caches, and a unit's caches
+    hold only its own types.
+    """
+    def __init__(self):
+        self.n = 0
+        self.compares = None
+
+    def __getstate__(self):
+        # the cache belongs to this process.
+        return dict(n = self.n)
+
+    def __setstate__(self, state):
+        self.n = state['n']
+        self.compares = None
 
 class TypeCompare:
     """
@@ -72,13 +99,35 @@ class TypeCompare:
 class TypeBase(object):
     """
     Base class for all C types.
+
+    Types read by type_from_xml are shared by every reference to them in
+    a unit, so must not be changed once made (other than by resolving
+    their aggregate references, which is done once).  Nor may any type
+    be changed after it has been spelled or compared, other than through
+    resolve_aggregates: both are cached.
+
+    Subclasses implement render_c() and compare_to().
     """
+    resolved = False
+    _c = None
+    _c_generation = -1
+
     def __init__(self, id, name = None):
         self.id = int(id)
         self.name = name
         self.constant = False
+        self._generation = interned(Generation, None, lambda key: Generation())
+
+    def __getstate__(self):
+        # cached spellings are recomputed after loading.
+        state = dict(self.__dict__)
+        state.pop('_c', None)
+        state.pop('_c_generation', None)
+        return state
 
     def __eq__(self, other):
+        if self is other:
+            return True
         return self.id != 0 and \
                self.id == other.id and \
                self.constant == other.constant
@@ -88,7 +137,33 @@ class TypeBase(object):
         
     def compare(self, other):
         """
-        Default type comparison is by id.
+        Compares this type with 'other', returning a TypeCompare result.
+        A type is always Equal to itself.
+        """
+        if self is other:
+            return TypeCompare.Equal(self, other)
+        
+        # only types of the same unit are cached, in that unit.
+        g = self._generation
+        if g is not other._generation:
+            return self.compare_to(other)
+        if g.compares is None:
+            g.compares = LRU(COMPARE_CACHE_SIZE)
+        
+        # the cache holds the types, so their ids are not reused.
+        key = (id(self), id(other))
+        hit = g.compares.get(key)
+        if hit is not None and hit[0] is self and hit[1] is other and \
+               hit[2] == g.n:
+            return hit[3]
+        
+        r = self.compare_to(other)
+        g.compares[key] = (self, other, g.n, r)
+        return r
+
+    def compare_to(self, other):
+        """
+        Compares with a distinct type.  Default type comparison is by id.
         """
         if self.id == other.id:
             return TypeCompare.Equal(self, other)
@@ -96,9 +171,30 @@ class TypeBase(object):
             return TypeCompare.Incompatible(self, other)
 
     def to_c(self):
+        """
+        Returns the C spelling of this type.
+        """
+        n = self._generation.n
+        if self._c_generation != n:
+            self._c = self.render_c()
+            self._c_generation = n
+        return self._c
+
+    def render_c(self):
       # raise ValueError, '%r has no to_c'%type(self)
       return '{type %d}' % (self.id)
 
+    def _resolve(self, type, aggregates):
+        """
+        resolve_aggregates for a type inside this one.  Replacing an
+        aggregate reference changes this type, so starts a new generation;
+        a reference already replaced is never seen again, so each starts
+        one only once.
+        """
+        if isinstance(type, AggregateRef):
+            self._generation.n += 1
+        return resolve_aggregates(type, aggregates)
+
 def resolve_aggregates(type, aggregates):
     if isinstance(type, AggregateRef):
         assert type.id in aggregates
@@ -116,7 +212,7 @@ class Integer(TypeBase):
         self.unsigned = False
         self.constant = False
 
-    def to_c(self):
+    def render_c(self):
         cc = ['', 'const '][self.constant]
         if self.name:
             return cc + self.name
@@ -124,7 +220,7 @@ class Integer(TypeBase):
             return cc + '%sint%d' % \
               (('', 'u')[self.unsigned], self.precision)
     
-    def compare(self, other):
+    def compare_to(self, other):
         # Bools are effectively zero extended.
         if isinstance(other, Boolean):
             return TypeCompare.ZeroExtend(self, other)
@@ -178,7 +274,7 @@ class Enum(TypeBase):
     def __init__(self, id, name = None):
         TypeBase.__init__(self, id, name)
 
-    def to_c(self):
+    def render_c(self):
         if self.name:
             return 'enum ' + self.name
         else:
@@ -194,10 +290,10 @@ class Float(TypeBase):
         TypeBase.__init__(self, id, name)
         self.precision = 0
 
-    def to_c(self):
+    def render_c(self):
         return self.name
         
-    def compare(self, other):
+    def compare_to(self, other):
         """
         Type comparison is by precision only.
         """
@@ -227,7 +323,7 @@ class Boolean(TypeBase):
     def __init__(self, id, name = None):
         TypeBase.__init__(self, id, name)
 
-    def compare(self, other):
+    def compare_to(self, other):
         """
         Always equal.
         """
@@ -239,7 +335,7 @@ class Boolean(TypeBase):
                 return Integer.construct(precision = 8, unsigned = True).compare(other)
             return TypeCompare.Incompatible(self, other)
 
-    def to_c(self):
+    def render_c(self):
         return 'bool'
 
     @staticmethod
@@ -258,22 +354,25 @@ class Function(TypeBase):
         self.arguments = []
 
     def resolve_interior_aggregates(self, types):
+        if self.resolved:
+            return
+        self.resolved = True
         if self.returns:
-            self.returns = resolve_aggregates(self.returns, types)
-        self.arguments = [resolve_aggregates(a, types) for a in self.arguments]
+            self.returns = self._resolve(self.returns, types)
+        self.arguments = [self._resolve(a, types) for a in self.arguments]
 
-    def to_c(self):
+    def render_c(self):
       return '%s %s(%s)' % \
           ( self.returns.to_c(), 
             self.name,
             ', '.join([x.to_c() for x in self.arguments]) )
 
-    def compare(self, other):
+    def compare_to(self, other):
         """
         By identity.
         (TODO: compare returns and args in detail?)
         """
-        TypeBase.compare(self, other)
+        return TypeBase.compare_to(self, other)
     
     @staticmethod
     def from_xml(t):
@@ -287,10 +386,10 @@ class Void(TypeBase):
     def __init__(self):
         TypeBase.__init__(self, 0, 'void')
 
-    def to_c(self):
+    def render_c(self):
         return 'void'
         
-    def compare(self, other):
+    def compare_to(self, other):
         """
         Always equal.
         """
@@ -308,10 +407,10 @@ class AddrOf(TypeBase):
         TypeBase.__init__(self, id, name)
         self.of = None
 
-    def to_c(self):
+    def render_c(self):
         return self.of.to_c() + '*'
         
-    def compare(self, other):
+    def compare_to(self, other):
         """
         Compares targets.
         """
@@ -321,7 +420,10 @@ class AddrOf(TypeBase):
             return TypeCompare.Incompatible(self, other)
 
     def resolve_interior_aggregates(self, types):
-        self.of = resolve_aggregates(self.of, types)
+        if self.resolved:
+            return
+        self.resolved = True
+        self.of = self._resolve(self.of, types)
 
     @staticmethod
     def from_xml(t):
@@ -347,12 +449,12 @@ class Structure(TypeBase):
 
     def resolve_interior_aggregates(self, types):
         for m in self.members:
-            m.resolve_aggregates(types)
+            m.type = self._resolve(m.type, types)
 
     def collect_interior_decls(self):
         return self.members
 
-    def to_c(self):
+    def render_c(self):
         if self.name:
             return 'struct %s' % self.name
         else:
@@ -385,7 +487,7 @@ class Union(TypeBase):
 
     def resolve_interior_aggregates(self, types):
         for m in self.members:
-            m.resolve_aggregates(types)
+            m.type = self._resolve(m.type, types)
 
     def collect_interior_decls(self):
         return self.members
@@ -395,7 +497,7 @@ class Union(TypeBase):
             if mm.binding.name == i:
                 return mm
 
-    def to_c(self):
+    def render_c(self):
         if self.name:
             return 'union %s' % self.name
         else:
@@ -423,14 +525,14 @@ class Array(TypeBase):
         self.domain = None
 
     def resolve_interior_aggregates(self, types):
-        self.type = resolve_aggregates(self.type, types)
+        self.type = self._resolve(self.type, types)
 
     def decompose_to_pointer(self):
         a = AddrOf()
         a.of = self.type
         return a
    
-    def to_c(self):
+    def render_c(self):
         domain = ''
         if self.domain.min is not None and self.domain.max is not None:
             domain = str(self.domain.max)
@@ -445,27 +547,77 @@ class Array(TypeBase):
             a.domain = type_from_xml(descend_one(t.find('domain')))
         return a
 
+g_keys = threading.local()
+
+class TypeKey(object):
+    """
+    Stands for one distinct type element in a unit's scope; see _type_key.
+    """
+    pass
+
 def type_from_xml(t):
-    kinds = {
-      'addr-of': AddrOf,
-      'float': Float,
-      'integer': Integer,
-      'void': Void,
-      'function': Function,
-      'structure': AggregateRef,
-      'array': AggregateRef,
-      'enum': Enum,
-      'boolean': Boolean,
-      'union': AggregateRef,
-    }
-
-    assert t.tag in kinds, 'unknown type ' + t.tag
-    return kinds[t.tag].from_xml(t)
+    """
+    Returns the type described by element 't', shared with every other
+    reference to the same type in the unit being read.
+    """
+    # the keys of 't' and its descendants are kept while its type (and
+    # so theirs) is made, rather than recomputed at every level.
+    keys = getattr(g_keys, 'memo', None)
+    if keys is not None:
+        return _interned_type(t, keys)
+    g_keys.memo = keys = {}
+    try:
+        return _interned_type(t, keys)
+    finally:
+        g_keys.memo = None
+
+def _interned_type(t, keys):
+    return interned(TypeBase, _type_key(t, keys), lambda key: _type_from_xml(t))
+
+def _type_key(t, keys):
+    """
+    Two type elements describe the same type exactly when their keys
+    are the same.  (The plugin only numbers aggregates, so the key is the
+    whole element: tag, attributes and children.)  The key is a TypeKey
+    interned on the tag, the attributes and the children's keys, so it
+    is built bottom up and hashes in constant time.  'keys' maps id(t)
+    to (t, key) for elements already seen.
+    """
+    seen = keys.get(id(t))
+    if seen is not None:
+        return seen[1]
+    flat = (t.tag, tuple(sorted(t.attrib.items())),
+            tuple([_type_key(c, keys) for c in t.getchildren()]))
+    key = interned(TypeKey, flat, lambda flat: TypeKey())
+    keys[id(t)] = (t, key)
+    return key
+
+type_kinds = {
+  'addr-of': AddrOf.from_xml,
+  'float': Float.from_xml,
+  'integer': Integer.from_xml,
+  'void': Void.from_xml,
+  'function': Function.from_xml,
+  'structure': AggregateRef.from_xml,
+  'array': AggregateRef.from_xml,
+  'enum': Enum.from_xml,
+  'boolean': Boolean.from_xml,
+  'union': AggregateRef.from_xml,
+}
+
+aggregate_kinds = dict(array = Array.from_xml,
+                       structure = Structure.from_xml,
+                       union = Union.from_xml)
+
+def _type_from_xml(t):
+    make = type_kinds.get(t.tag)
+    assert make is not None, 'unknown type ' + t.tag
+    return make(t)
 
 def aggregate_from_xml(t):
-    kinds = dict(array = Array, structure = Structure, union = Union)
-    assert t.tag in kinds
-    return kinds[t.tag].from_xml(t)
+    make = aggregate_kinds.get(t.tag)
+    assert make is not None
+    return make(t)
 
 def _test():
     uint = Integer.construct(precision = 32, unsigned = True)
@@ -17,7 +17,11 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import heapq
 import lighthouse.types as types
+import lighthouse.statements as statements
+import lighthouse.instrument as instrument
+from lighthouse.misc import LineIndex
 
 class Unit(object):
     """
@@ -30,26 +34,101 @@ class Unit(object):
         self._language = None
         self._types = {}
         self._functions = []
+        self._aggregate_decls = None
+        self._call_sites = None
+        self._lines = None
+
+    def __getstate__(self):
+        # the line index is cheap to rebuild and not worth storing.
+        state = dict(self.__dict__)
+        state['_lines'] = None
+        return state
 
     def __repr__(self):
         return '<%s translation-unit file %r>' % \
                 (self.lang, self.filename)
     
     def finalise(self):
+        self.finalise_types()
+        for f in self._functions:
+            self.finalise_function(f)
+
+    def finalise_types(self):
+        """
+        Resolves references between the aggregate types.  This must be
+        done before any function is finalised.
+        """
+        mark = instrument.start('finalise_types')
         for tid, t in self._types.iteritems():
             self._types[tid] = types.resolve_aggregates(t, self._types)
+        self._aggregate_decls = None
+        instrument.stop(mark)
 
-        for f in self._functions:
-            f.resolve_aggregates(self._types)
-            f.resolve_temporary_names()
+    def finalise_function(self, f):
+        """
+        Resolves aggregates and temporary names in the function 'f',
+        which need not (yet) be in self.functions.
+        """
+        mark = instrument.start('finalise')
+        if self._aggregate_decls is None:
+            self._aggregate_decls = f.collect_aggregate_decls(self._types)
+        f.finalise(self._types, self._aggregate_decls)
+        self._call_sites = None
+        instrument.stop(mark)
+        instrument.count('functions')
+
+    def call_sites(self):
+        """
+        Returns a mapping of called function name to a list of
+        (order, function, block, call) tuples, where 'order' is the
+        position of the call in a walk over every function's blocks in
+        natural order.  Built on first use.
+        """
+        if self._call_sites is None:
+            index = {}
+            order = 0
+            for fn in self._functions:
+                for block in fn.blocks_in_natural_order():
+                    for stmt in block.statements:
+                        if isinstance(stmt, statements.Call):
+                            name = stmt.fnexpr.to_c()
+                            index.setdefault(name, []).append((order, fn, block, stmt))
+                            order += 1
+            self._call_sites = index
+        return self._call_sites
+
+    def calls_to(self, names):
+        """
+        Generates (name, function, block, call) for each call to one of
+        'names', in walk order.
+        """
+        index = self.call_sites()
+        
+        def tagged(name, sites):
+            for order, fn, block, stmt in sites:
+                yield order, name, fn, block, stmt
+        
+        found = [tagged(name, index[name]) for name in names if name in index]
+        for order, name, fn, block, stmt in heapq.merge(*found):
+            yield name, fn, block, stmt
 
     def get_source(self):
         assert self._raw_source is not None
         return self._raw_source
     def set_source(self, src):
         self._raw_source = src
+        self._lines = None
     source = property(get_source, set_source)
     
+    def get_lines(self):
+        """
+        The source's LineIndex, built on first use.
+        """
+        if self._lines is None:
+            self._lines = LineIndex(self.source)
+        return self._lines
+    lines = property(get_lines)
+    
     def get_lang(self):
         assert self._language is not None
         return self._language
@@ -69,10 +148,12 @@ class Unit(object):
         return self._types
     def set_types(self, t):
         self._types = t
+        self._aggregate_decls = None
     types = property(get_types, set_types)
     
     def get_functions(self):
         return self._functions
     def set_functions(self, f):
         self._functions = f
+        self._call_sites = None
     functions = property(get_functions, set_functions)
@@ -1,5 +1,4 @@
 import simple_fmt
-import bbgraph
 
 TRY_PYGMENTS = True
 
@@ -9,40 +8,33 @@ class line(object):
         self.raw = raw
         self.formatted = fmt
         self.function = None
-        self.bbgraph = None
+        self.function_index = None # of self.function, in unit.functions
         self.decls = []
     
     def columns(self):
-        out = []
-        for col, char in enumerate(self.raw):
-            found = False
-            for d in self.decls:
-                if d.location.column == col+1:
-                    found = True
-                    break
-            if found:
-                yield d
-            else:
-                yield None
+        # the first decl at each column.
+        at = {}
+        for d in reversed(self.decls):
+            at[d.location.column] = d
+        for col in xrange(len(self.raw)):
+            yield at.get(col+1)
 
 def format_source(unit):
-    raw_lines = unit.source.split('\n')
+    raw_lines = unit.lines
     lines = highlight_lines(unit).split('\n')
     out = []
     
     line_functions = {}
     line_decls = {}
     
-    for f in unit.functions:
-        line_functions[f.location.line] = line_functions.get(f.location.line, []) + [f]
+    for i, f in enumerate(unit.functions):
+        line_functions[f.location.line] = line_functions.get(f.location.line, []) + [(i, f)]
     for d in decl_markers(unit):
         line_decls[d.location.line] = line_decls.get(d.location.line, []) + [d]
     
     for lineno, linefmt in enumerate(lines):
         l = line(lineno, raw_lines[lineno], linefmt)
-        l.function = line_functions.get(l.number, [None])[0]
-        if l.function:
-            l.bbgraph = bbgraph.construct(l.function)
+        l.function_index, l.function = line_functions.get(l.number, [(None, None)])[0]
         l.decls = line_decls.get(l.number, [])
         out.append(l)
     
@@ -16,7 +16,7 @@ class edge(object):
         self.annot = None
         self.value = None
 
-SpecialStatements = (ST.cond, ST.switch)
+SpecialStatements = (ST.Cond, ST.Switch)
 
 class block(object):
     def __init__(self):
@@ -30,47 +30,44 @@ class block(object):
         self.out_edges.append(e)
         return e
         
+    # highlighting is done by cfg.js, with handlers on the whole page.
     LINEBLOCK = """<div id="lineblock_%(fn_name)s_%(id)d_%(line)d" class="lineblock lineblock_%(fn_name)s_%(line)d" title="Line %(line)d"><pre>"""
-    MOUSEHANDLER = """<script type="text/javascript">
-$('#lineblock_%(fn_name)s_%(id)d_%(line)d').bind("mouseenter mouseleave", function(e) {
-    $('#lineno_%(line)d').toggleClass('lineno_hilight');
-    $(this).toggleClass('lineblock_hilight');
-  });
-</script>"""
-    POSTBLOCK = """<script type="text/javascript">
-$('#block_%(fn_name)s_%(id)d').bind("mouseenter", function(e) {
-    highlightArrows("%(fn_name)s", %(id)d);
-  });
-$('#block_%(fn_name)s_%(id)d').bind("mouseleave", function(e) {
-    unhighlightArrows("%(fn_name)s", %(id)d);
-  });
-</script>"""
     
-    @property
-    def statements(self):
+    def lines(self):
+        """
+        The block's statements as [line, [html, ...]] for each line they
+        came from.
+        """
         out = []
         for loc, stmts in self.bb.statements_by_line():
             line = 0
             if loc:
                 line = loc.line
-            v = dict(line = line, fn_name = self.fn_name, id = self.bb.id)
-            out.append(block.LINEBLOCK % v)
-            out += [htmlencode(s.to_c()) + '<br/>' for s in stmts if not isinstance(s, SpecialStatements)]
+            text = [htmlencode(s.to_c()) for s in stmts if not isinstance(s, SpecialStatements)]
             if len(stmts):
                 ls = stmts[-1]
-                if isinstance(ls, ST.cond):
-                    out += [ 'if ' + htmlencode(ls.cond_to_c()) + '<br/>',
-                             'if not ' + htmlencode(ls.cond_to_c()) ]
-                if isinstance(ls, ST.switch):
-                    out += [ 'switch ' + htmlencode(ls.expr.to_c()) + '<br/>' ]
-                    out += [ '  case ' + htmlencode(str(x)) + '<br/>' for x in ls.mapping.keys() ]
-                    out.append('  default')
+                if isinstance(ls, ST.Cond):
+                    text += [ 'if ' + htmlencode(ls.cond_to_c()),
+                              'if not ' + htmlencode(ls.cond_to_c()) ]
+                if isinstance(ls, ST.Switch):
+                    text += [ 'switch ' + htmlencode(ls.expr.to_c()) ]
+                    text += [ '  case ' + htmlencode(c.label()) for c in ls.cases ]
+                    text.append('  default')
+            out.append([line, text])
+        return out
+    
+    @property
+    def statements(self):
+        out = []
+        for line, text in self.lines():
+            v = dict(line = line, fn_name = self.fn_name, id = self.bb.id)
+            out.append(block.LINEBLOCK % v)
+            out.append('<br/>'.join(text))
             out.append('</pre></div>')
-            out.append(block.MOUSEHANDLER % v)
         return ''.join(out)
     
     def format(self):
-        fmt = '<div id="block_%(fn_name)s_%(id)d" class="basicblock">%(statements)s</div>' + block.POSTBLOCK
+        fmt = '<div id="block_%(fn_name)s_%(id)d" class="basicblock">%(statements)s</div>'
         return fmt % dict(fn_name = self.fn_name, id = self.bb.id, statements = self.statements)
         
 class arrow(object):
@@ -108,67 +105,99 @@ var r = Raphael(d, cfgGraphWidth, h.getSize().y);
             for i, edge in enumerate(b.out_edges):
                 a = arrow(edge)
                 if edge.kind in edge.Structured:
-                    a.offset = - (len(b.out_edges) - b.out_edges.index(edge))
+                    a.offset = - (len(b.out_edges) - i)
                 a.start = b.bb.id
                 a.end = edge.target
                 self.arrows.append(a)
         self.rank_arrows()
     
     def rank_arrows(self):
-        def find(id):
-            for x in self.blocks:
-                if id == x.bb.id:
-                    return x
+        """
+        Sets the depth of each arrow (the number of blocks it spans) and
+        its rank (how far out it is drawn): one more than the depth of
+        the deepest arrow it passes, plus its own depth.
         
-        def indices(st, ed):
-            return self.blocks.index(st), self.blocks.index(ed)
+        An arrow passes position x if it runs forward over the block whose
+        *id* is x.  Comparing positions with ids is an old slip, but the
+        layouts depend on it, so it stays.  Backward arrows pass nothing.
+        """
+        pos = {}
+        for i, b in enumerate(self.blocks):
+            pos.setdefault(b.bb.id, i)
+        n = len(self.blocks)
         
-        def block_span(st, ed):
-            sti, edi = indices(st, ed)
-            return abs(edi - sti)
+        spans = []
+        for a in self.arrows:
+            st, ed = pos[a.start], pos[a.end]
+            a.depth = abs(ed - st)
+            spans.append((st, ed))
         
-        def arrows_in_block(b):
-            id = self.blocks.index(b)
-            out = set()
-            for a in self.arrows:
-                sti, edi = indices(find(a.start), find(a.end))
-                for x in range(sti, edi + 1):
-                    if id == self.blocks[x].bb.id:
-                        out.add(a)
-            return out
+        # deepest[x]: depth of the deepest forward arrow over position x.
+        # deepest arrows first, so each position need only be set once;
+        # after[] skips runs already set.
+        deepest = [0] * n
+        after = range(n + 1)
+        def unset(i):
+            root = i
+            while after[root] != root:
+                root = after[root]
+            while after[i] != root:
+                after[i], i = root, after[i]
+            return root
+        forward = [(a.depth, st, ed) for a, (st, ed) in zip(self.arrows, spans) if st <= ed]
+        forward.sort(reverse = True)
+        for depth, st, ed in forward:
+            i = unset(st)
+            while i <= ed:
+                deepest[i] = depth
+                after[i] = i + 1
+                i = unset(i + 1)
         
-        def max_rank_in_block(b):
-            depths = [a.depth for a in arrows_in_block(b)]
-            if depths:
-                return max(depths)
-            return 0
+        # passed[x]: what an arrow over position x passes (see above).
+        passed = [0] * n
+        for x in range(n):
+            if x in pos:
+                passed[x] = deepest[pos[x]]
         
-        def arrow_span(st, ed):
-            ranks = []
-            sti, edi = indices(st, ed)
-            for i in range(sti, edi + 1):
-                ranks.append(max_rank_in_block(self.blocks[i]))
-            if ranks:
-                return max(ranks) + 1
-            else:
-                return 1
-            
-        for a in self.arrows:
-            s, e = find(a.start), find(a.end)
-            a.depth = block_span(s, e)
-        for a in self.arrows:
-            s, e = find(a.start), find(a.end)
-            a.rank = arrow_span(s, e) + a.depth
+        # maxima of passed[] over runs of each power of two, so the
+        # maximum over any run is that of two overlapping ones.
+        table = [passed]
+        k = 1
+        while 2 * k <= n:
+            prev = table[-1]
+            table.append([max(prev[i], prev[i + k]) for i in range(len(prev) - k)])
+            k *= 2
+        
+        for a, (st, ed) in zip(self.arrows, spans):
+            widest = 0
+            if st <= ed:
+                level = (ed - st + 1).bit_length() - 1
+                row = table[level]
+                widest = max(row[st], row[ed - (1 << level) + 1])
+            a.rank = widest + 1 + a.depth
     
     def format_arrows(self):
         arrows = '\n'.join([a.format(self.fn_name) for a in self.arrows])
         return graph.ARROWBLOCK % dict(fn_name = self.fn_name, arrows = arrows)
 
+    def describe(self):
+        """
+        The graph as plain data, for cfg.js to draw: the blocks in order
+        as [id, lines] (see block.lines), and the arrows as [rank, start,
+        end, offset].
+        """
+        return dict(name = self.fn_name,
+                    blocks = [[b.bb.id, b.lines()] for b in self.blocks],
+                    arrows = [[a.rank, a.start, a.end, a.offset] for a in self.arrows])
+
     def format(self):
         return '<table class="blockgraph"><tr><td>' + ''.join([b.format() for b in self.blocks]) + \
                  '</td><td>' + self.format_arrows() + '</td></tr></table>'
 
-def construct(fn):
+def build(fn):
+    """
+    Returns the graph of 'fn', with its arrows laid out.
+    """
     g = graph()
     g.fn_name = fn.name
     for bb in fn.blocks_in_natural_order():
@@ -177,16 +206,23 @@ def construct(fn):
         b.fn_name = fn.name
         for s in bb.statements:
             # Look for statements containing edges (conditions, and switch statements)
-            if isinstance(s, ST.cond):
+            if isinstance(s, ST.Cond):
                 b.add_out_edge(s.then, edge.IfThen)
                 b.add_out_edge(s.else_, edge.IfElse)
-            elif isinstance(s, ST.switch):
-                for vv, b_id in s.mapping.items():
+            elif isinstance(s, ST.Switch):
+                for b_id in s.targets():
                     b.add_out_edge(b_id, edge.SwitchCase)
-                b.add_out_edge(s.default, edge.SwitchDefault)
+                if s.default is not None:
+                    b.add_out_edge(s.default, edge.SwitchDefault)
         for e in bb.next:
             b.add_out_edge(e, edge.Basic)
         g.add(b)
 
     g.make_arrows()
-    return g.format()
\ No newline at end of file
+    return g
+
+def construct(fn):
+    return build(fn).format()
+
+def describe(fn):
+    return build(fn).describe()
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""
+Compressed, content-addressed storage for uploaded reports.
+
+A blob is stored once, zlib compressed, under the SHA-1 of its
+uncompressed contents, so identical uploads cost nothing after the
+first.  Reports are split in two before storing: the <raw-source>
+text, which only changes when the file does, and the rest (the IR,
+with an empty <raw-source>), which changes with every compiler or
+plugin change.  Both directions stream in CHUNK sized pieces: nothing
+holds a whole report.
+"""
+
+import os, os.path, zlib, tempfile, errno
+from hashlib import sha1
+from django.conf import settings
+import lhpath
+import lighthouse.input
+
+CHUNK = 64 * 1024
+LEVEL = 6
+SUFFIX = '.z'
+
+OPEN = '<raw-source>'
+CLOSE = '</raw-source>'
+
+def default_path():
+    return getattr(settings, 'LHA_BLOBS', os.path.join(settings.ROOT, 'blobs'))
+
+class Writer(object):
+    """
+    Compresses and hashes what is written; close() stores it and
+    returns its digest.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.hash = sha1()
+        self.z = zlib.compressobj(LEVEL)
+        fd, self.tmp = tempfile.mkstemp(suffix = '.tmp', dir = store.path)
+        self.f = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        self.hash.update(data)
+        self.f.write(self.z.compress(data))
+
+    def close(self):
+        self.f.write(self.z.flush())
+        self.f.close()
+        digest = self.hash.hexdigest()
+        fn = self.store.filename(digest)
+        if os.path.exists(fn):
+            os.unlink(self.tmp) # already have it
+        else:
+            where = os.path.dirname(fn)
+            if not os.path.isdir(where):
+                try:
+                    os.makedirs(where)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            os.rename(self.tmp, fn)
+        return digest
+
+    def abort(self):
+        self.f.close()
+        os.unlink(self.tmp)
+
+class Stream(object):
+    """
+    A read-only file object over an iterable of strings.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = ''
+
+    def read(self, n = -1):
+        while n < 0 or len(self.buf) < n:
+            try:
+                self.buf += self.chunks.next()
+            except StopIteration:
+                break
+        if n < 0:
+            n = len(self.buf)
+        out, self.buf = self.buf[:n], self.buf[n:]
+        return out
+
+    def __iter__(self):
+        if self.buf:
+            yield self.buf
+            self.buf = ''
+        for chunk in self.chunks:
+            yield chunk
+
+    def close(self):
+        self.chunks = iter(())
+        self.buf = ''
+
+class BlobStore(object):
+    def __init__(self, path = None):
+        self.path = path or default_path()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def filename(self, digest):
+        return os.path.join(self.path, digest[:2], digest[2:] + SUFFIX)
+
+    def exists(self, digest):
+        return os.path.exists(self.filename(digest))
+
+    def writer(self):
+        return Writer(self)
+
+    def put(self, f):
+        """
+        Stores the contents of file object 'f', returning their digest.
+        """
+        w = self.writer()
+        try:
+            for chunk in iter(lambda: f.read(CHUNK), ''):
+                w.write(chunk)
+        except:
+            w.abort()
+            raise
+        return w.close()
+
+    def chunks(self, digest):
+        """
+        Yields the contents of the blob 'digest', decompressed a piece
+        at a time.
+        """
+        f = open(self.filename(digest), 'rb')
+        try:
+            z = zlib.decompressobj()
+            for data in iter(lambda: f.read(CHUNK), ''):
+                while data:
+                    out = z.decompress(data, CHUNK)
+                    if out:
+                        yield out
+                    data = z.unconsumed_tail
+            out = z.flush()
+            if out:
+                yield out
+        finally:
+            f.close()
+
+    def open(self, digest):
+        return Stream(self.chunks(digest))
+
+# --- splitting reports.
+def _pieces(chunks):
+    """
+    Yields (part, data) over 'chunks': part 0 is up to and including
+    the first OPEN, part 1 the source text up to the next CLOSE, and
+    part 2 the rest.  An empty piece marks each change of part.
+    """
+    part, buf = 0, ''
+    for chunk in chunks:
+        buf += chunk
+        while part < 2:
+            tag = part == 0 and OPEN or CLOSE
+            i = buf.find(tag)
+            if i < 0:
+                # keep enough to find a tag split between chunks.
+                keep = len(tag) - 1
+                if len(buf) > keep:
+                    yield part, buf[:-keep]
+                    buf = buf[-keep:]
+                break
+            if part == 0:
+                i += len(tag)
+            yield part, buf[:i]
+            buf = buf[i:]
+            part += 1
+        if part == 2 and buf:
+            yield part, buf
+            buf = ''
+    if buf:
+        yield part, buf
+
+def store_report(store, f):
+    """
+    Stores the report read from file object 'f', returning the digests
+    of its IR and of its source.
+    """
+    ir, source = store.writer(), store.writer()
+    try:
+        for part, data in _pieces(iter(lambda: f.read(CHUNK), '')):
+            if part == 1:
+                source.write(data)
+            else:
+                ir.write(data)
+    except:
+        ir.abort()
+        source.abort()
+        raise
+    return ir.close(), source.close()
+
+def _joined(store, ir, source):
+    injected = False
+    for part, data in _pieces(store.chunks(ir)):
+        if part == 1:
+            if not injected:
+                injected = True
+                for chunk in store.chunks(source):
+                    yield chunk
+        elif data:
+            yield data
+
+def open_report(store, ir, source):
+    """
+    Returns a file object reading the report stored as 'ir' and 'source'
+    (see store_report), exactly as uploaded.
+    """
+    return Stream(_joined(store, ir, source))
+
+def find_function(f, index):
+    """
+    Reads the report from file object 'f' only as far as its function
+    'index' (counting from 0, in document order), returning (unit,
+    function), or (unit, None) if it has fewer functions.
+    """
+    u = None
+    try:
+        for i, (u, fn) in enumerate(lighthouse.input.iterparse(f, keep = False)):
+            if i == index:
+                return u, fn
+    finally:
+        f.close()
+    return u, None
+
+def load_function(store, ir, source, index):
+    return find_function(open_report(store, ir, source), index)
@@ -0,0 +1,154 @@
+"""
+A per-process cache of parsed units and their rendered lines, so that
+showing a unit again neither reparses its report nor reformats it.
+
+Stored units are keyed by id and by the digests of their report, so a
+replaced unit is never served stale; saving or deleting a unit also
+drops its entries at once, to free the memory.  Reports read from
+files are keyed by name, size and modification time.
+
+The cache is bounded by an estimate of its size in bytes (LHA_VIEW_CACHE,
+default 128MB), taken from the size of each report: measured over units
+from lh-synth, the object model and the rendered lines together take
+about eight times the XML (BYTES_PER_XML_BYTE).
+"""
+
+import os, os.path, threading
+from hashlib import sha1
+from collections import OrderedDict
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+import lhpath
+import lighthouse.input
+import codepresentation
+from models import Unit
+
+DEFAULT_SIZE = 128 * 1024 * 1024
+BYTES_PER_XML_BYTE = 8
+
+class Entry(object):
+    def __init__(self, unit, size):
+        self.unit = unit
+        self.lines = codepresentation.format_source(unit)
+        self.size = size
+
+class Counted(object):
+    """
+    Reads file object 'f', counting the bytes read.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read(self, n = -1):
+        data = self.f.read(n)
+        self.count += len(data)
+        return data
+
+class ViewCache(object):
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.items = OrderedDict() # key -> Entry, least recent first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key):
+        self.lock.acquire()
+        try:
+            entry = self.items.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.items[key] = entry
+            self.hits += 1
+            return entry
+        finally:
+            self.lock.release()
+
+    def _put(self, key, entry):
+        self.lock.acquire()
+        try:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.used -= old.size
+            if entry.size > self.size:
+                return # would only evict everything else
+            self.items[key] = entry
+            self.used += entry.size
+            while self.used > self.size:
+                k, e = self.items.popitem(last = False)
+                self.used -= e.size
+                self.evictions += 1
+        finally:
+            self.lock.release()
+
+    def _load(self, key, f):
+        entry = self._get(key)
+        if entry is None:
+            counted = Counted(f)
+            try:
+                u = lighthouse.input.parse(counted, cache = False)
+            finally:
+                f.close()
+            entry = Entry(u, counted.count * BYTES_PER_XML_BYTE)
+            self._put(key, entry)
+        return entry
+
+    def _unit_key(self, row):
+        if row.ir:
+            return ('unit', row.pk, row.ir, row.source)
+        return ('unit', row.pk, sha1(row.raw_bytes()).hexdigest())
+
+    def for_unit(self, row):
+        """
+        Returns the Entry for the stored Unit 'row'.
+        """
+        return self._load(self._unit_key(row), row.report())
+
+    def cached_unit(self, row):
+        """
+        Returns the Entry for the stored Unit 'row' if it is cached, or None.
+        """
+        return self._get(self._unit_key(row))
+
+    def for_file(self, fn):
+        """
+        Returns the Entry for the report in file 'fn'.
+        """
+        st = os.stat(fn)
+        return self._load(('file', os.path.abspath(fn), st.st_size, st.st_mtime),
+                          open(fn, 'rb'))
+
+    def invalidate(self, pk):
+        """
+        Drops the entries of the stored unit 'pk'.
+        """
+        self.lock.acquire()
+        try:
+            for key in [k for k in self.items if k[0] == 'unit' and k[1] == pk]:
+                self.used -= self.items.pop(key).size
+        finally:
+            self.lock.release()
+
+    def metrics(self):
+        """
+        Returns this process's counters, as a list of (name, value).
+        """
+        return [
+            ('lha_view_cache_hits_total', self.hits),
+            ('lha_view_cache_misses_total', self.misses),
+            ('lha_view_cache_evictions_total', self.evictions),
+            ('lha_view_cache_entries', len(self.items)),
+            ('lha_view_cache_bytes', self.used),
+        ]
+
+g_cache = ViewCache(getattr(settings, 'LHA_VIEW_CACHE', DEFAULT_SIZE))
+
+def _changed(sender, instance, **kwargs):
+    g_cache.invalidate(instance.pk)
+
+post_save.connect(_changed, sender = Unit)
+post_delete.connect(_changed, sender = Unit)
@@ -0,0 +1,115 @@
+"""
+Background workers which analyse the reports in the spool (see
+spool.py) and store them, with their annotations, in the database.
+Run them with 'manage.py ingest'.
+"""
+
+import os, os.path, time, signal, traceback
+import multiprocessing
+from django.conf import settings
+from django.db import connection, transaction
+import lhpath
+import lighthouse.input
+import lighthouse.analysis as analysis
+import lighthouse.diagnostics as diagnostics
+from models import Project, Unit
+from sinks import AnnotationSink
+import spool as spooling
+import blobs
+
+POLL = 1.0 # seconds between looks at an empty spool
+
+g_blobs = blobs.BlobStore()
+
+g_registry = analysis.AnalyserRegistry([
+    os.path.expanduser('~/.lh/checkers.py'),
+    os.path.join(settings.ROOT, '..', 'analysers', 'checkers.py'),
+])
+
+def _store(meta, u, digests, found):
+    project, created = Project.objects.get_or_create(name = meta['project'])
+    ir, source = digests
+    unit = Unit(filename = u.filename, ir = ir, source = source, project = project,
+                reporter = meta['reporter'])
+    unit.save()
+    sink = AnnotationSink(unit)
+    for d in found:
+        sink.emit(d)
+    sink.close()
+    return unit
+
+if hasattr(transaction, 'atomic'):
+    _store = transaction.atomic(_store)
+elif hasattr(transaction, 'commit_on_success'):
+    _store = transaction.commit_on_success(_store)
+
+def process(job, stats):
+    """
+    Parses, analyses and stores one job, adding to 'stats'.
+    """
+    meta = job.meta()
+    start = time.time()
+    u = lighthouse.input.parse(job.xml(), cache = False)
+    found = diagnostics.MemorySink()
+    analysis.analyse(u, g_registry.analysers(), found)
+    stats['analysis_sum'] += time.time() - start
+
+    # analysis and blob writes are done outside the transaction, to keep
+    # it short.  a blob left by a failed store is harmless: it is only
+    # found again by its digest.
+    f = open(job.xml(), 'rb')
+    try:
+        digests = blobs.store_report(g_blobs, f)
+    finally:
+        f.close()
+    _store(meta, u, digests, found.diagnostics)
+    job.done()
+
+    latency = time.time() - spooling.received(job.name)
+    stats['done'] += 1
+    stats['latency_sum'] += latency
+    stats['latency_max'] = max(stats['latency_max'], latency)
+
+def work(path = None, poll = POLL):
+    """
+    Processes jobs from the spool until killed.
+    """
+    # ^C is for the parent, which stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # never share the parent's database connection.
+    connection.close()
+
+    spool = spooling.Spool(path)
+    stats = dict(done = 0, failed = 0, latency_sum = 0.0, latency_max = 0.0,
+                 analysis_sum = 0.0)
+    while True:
+        job = spool.claim()
+        if job is None:
+            time.sleep(poll)
+            continue
+        try:
+            process(job, stats)
+        except Exception:
+            job.fail(traceback.format_exc())
+            stats['failed'] += 1
+        spool.record(stats)
+
+def run(path = None, workers = None, poll = POLL):
+    """
+    Runs 'workers' worker processes (default: one per cpu) until
+    interrupted.  Jobs left claimed by an earlier run are requeued.
+    """
+    spool = spooling.Spool(path)
+    spool.recover()
+    procs = [multiprocessing.Process(target = work, args = (spool.path, poll))
+             for i in range(workers or multiprocessing.cpu_count())]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
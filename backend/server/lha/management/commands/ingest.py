@@ -0,0 +1,17 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from lha import ingest
+
+class Command(BaseCommand):
+    help = 'Analyses spooled reports into the database, using a pool of workers.'
+    option_list = BaseCommand.option_list + (
+        make_option('-j', '--workers', type = 'int', default = None,
+                    help = 'number of worker processes (default: one per cpu)'),
+        make_option('--poll', type = 'float', default = ingest.POLL,
+                    help = 'seconds between looks at an empty spool'),
+        make_option('--spool', default = None,
+                    help = 'spool directory (default: settings.LHA_SPOOL)'),
+    )
+
+    def handle(self, *args, **options):
+        ingest.run(options['spool'], options['workers'], options['poll'])
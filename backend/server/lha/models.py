@@ -1,5 +1,6 @@
 from django.db import models
-import zlib, base64
+from cStringIO import StringIO
+import blobs
 
 class Project(models.Model):
     name = models.TextField(primary_key = True)
@@ -7,12 +8,39 @@ class Project(models.Model):
 
 class Unit(models.Model):
     filename = models.TextField(help_text = 'Filename extracted from report')
-    raw = models.XMLField(help_text = 'Raw XML of report')
+    raw = models.XMLField(blank = True, help_text = 'Raw XML of report, for units stored before blobs')
+    ir = models.CharField(max_length = 40, blank = True, db_index = True,
+                          help_text = 'Digest of the report without its source (see blobs.py)')
+    source = models.CharField(max_length = 40, blank = True, db_index = True,
+                              help_text = 'Digest of the raw source of the report')
     project = models.ForeignKey(Project)
     date = models.DateTimeField(auto_now_add = True, help_text = 'Time of report')
     reporter = models.TextField(help_text = 'Network address of reporting compiler')
     excluded_checkers = models.TextField(help_text = 'Excluded checkers for this unit (comma separated)')
-    
+
+    def raw_bytes(self):
+        if isinstance(self.raw, unicode):
+            return self.raw.encode('utf-8')
+        return self.raw
+
+    def report(self, store = None):
+        """
+        Returns a file object reading the report as uploaded.
+        """
+        if not self.ir:
+            return StringIO(self.raw_bytes())
+        return blobs.open_report(store or blobs.BlobStore(), self.ir, self.source)
+
+    def function(self, index, store = None):
+        """
+        Returns (unit, function) for the function 'index' (counting from
+        0, in the order of unit.functions), parsing the report no further
+        than it.
+        """
+        if not self.ir:
+            return blobs.find_function(StringIO(self.raw_bytes()), index)
+        return blobs.load_function(store or blobs.BlobStore(), self.ir, self.source, index)
+
 
 class Annotation(models.Model):
     SEVERITY_INFO = 0
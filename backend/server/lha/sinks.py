@@ -0,0 +1,50 @@
+from django.db import transaction
+import lhpath
+import lighthouse.diagnostics as diagnostics
+from models import Annotation
+
+SEVERITIES = {
+    'Error':   Annotation.SEVERITY_ERROR,
+    'Warning': Annotation.SEVERITY_WARNING,
+}
+
+class AnnotationSink(diagnostics.Sink):
+    """
+    Saves diagnostics as Annotations of 'unit' (a models.Unit).  They are
+    held until close(), then inserted together.
+    """
+    def __init__(self, unit):
+        self.unit = unit
+        self.pending = []
+
+    def emit(self, diag):
+        severity = SEVERITIES.get(diag.cls, Annotation.SEVERITY_INFO)
+        for label, loc in diag.locations or [('', None)]:
+            self.pending.append(Annotation(
+                unit = self.unit,
+                lineno = loc and loc.line or 0,
+                column = loc and loc.column or 0,
+                severity = severity,
+                note = diag.message,
+                text = loc and '%s at %s' % (label, loc) or '',
+                tag = label,
+                checker = diag.checker))
+
+    def close(self):
+        if self.pending:
+            _insert(self.pending)
+        self.pending = []
+
+def _insert(annotations):
+    if hasattr(Annotation.objects, 'bulk_create'):
+        Annotation.objects.bulk_create(annotations)
+    else:
+        _save_each(annotations)
+
+def _save_each(annotations):
+    for a in annotations:
+        a.save()
+
+# older django: at least do it in one transaction.
+if hasattr(transaction, 'commit_on_success'):
+    _save_each = transaction.commit_on_success(_save_each)
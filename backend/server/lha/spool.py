@@ -0,0 +1,186 @@
+"""
+A directory of uploaded reports waiting to be analysed.
+
+Each report is a directory holding the XML ('unit.lh') and what the
+uploader told us about it ('meta.json').  Reports are written under
+tmp/ and renamed into new/ when complete; a worker claims one by
+renaming it into work/, and removes it when done or moves it to
+failed/.  Renames within a filesystem are atomic, so any number of
+web and worker processes can share the spool without locks.
+
+Workers also keep running totals in stats/<pid>.json, from which
+metrics() reports throughput and latency.
+"""
+
+import os, os.path, time, json, shutil, errno, itertools
+from django.conf import settings
+
+DIRS = ('tmp', 'new', 'work', 'failed', 'stats')
+CHUNK = 64 * 1024
+
+_seq = itertools.count()
+
+def default_path():
+    return getattr(settings, 'LHA_SPOOL', os.path.join(settings.ROOT, 'spool'))
+
+def received(name):
+    """
+    When the job called 'name' was spooled.
+    """
+    return float(name.split('-', 1)[0])
+
+class Job(object):
+    def __init__(self, spool, name, state):
+        self.spool = spool
+        self.name = name
+        self.state = state
+        self._meta = None
+
+    def path(self, *rest):
+        return os.path.join(self.spool.path, self.state, self.name, *rest)
+
+    def xml(self):
+        return self.path('unit.lh')
+
+    def meta(self):
+        if self._meta is None:
+            self._meta = json.load(open(self.path('meta.json')))
+        return self._meta
+
+    def _move(self, state):
+        os.rename(self.path(), os.path.join(self.spool.path, state, self.name))
+        self.state = state
+
+    def done(self):
+        shutil.rmtree(self.path(), ignore_errors = True)
+
+    def fail(self, reason):
+        open(self.path('error.txt'), 'w').write(reason)
+        self._move('failed')
+
+class Spool(object):
+    def __init__(self, path = None):
+        self.path = path or default_path()
+        for d in DIRS:
+            where = os.path.join(self.path, d)
+            if not os.path.isdir(where):
+                try:
+                    os.makedirs(where)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+
+    def _list(self, state):
+        try:
+            return sorted(os.listdir(os.path.join(self.path, state)))
+        except OSError:
+            return []
+
+    def put(self, upload, project, reporter):
+        """
+        Spools the file object or django UploadedFile 'upload', returning
+        the job's name.  Names sort in order of arrival.
+        """
+        now = time.time()
+        name = '%017.6f-%d-%d' % (now, os.getpid(), _seq.next())
+        tmp = os.path.join(self.path, 'tmp', name)
+        os.mkdir(tmp)
+        try:
+            out = open(os.path.join(tmp, 'unit.lh'), 'wb')
+            try:
+                if hasattr(upload, 'chunks'):
+                    for chunk in upload.chunks():
+                        out.write(chunk)
+                else:
+                    shutil.copyfileobj(upload, out, CHUNK)
+            finally:
+                out.close()
+            json.dump(dict(project = project, reporter = reporter, received = now),
+                      open(os.path.join(tmp, 'meta.json'), 'w'))
+            os.rename(tmp, os.path.join(self.path, 'new', name))
+        except:
+            shutil.rmtree(tmp, ignore_errors = True)
+            raise
+        return name
+
+    def claim(self):
+        """
+        Returns the oldest unclaimed Job, or None if there are none.
+        """
+        for name in self._list('new'):
+            try:
+                os.rename(os.path.join(self.path, 'new', name),
+                          os.path.join(self.path, 'work', name))
+            except OSError:
+                continue # another worker got it
+            return Job(self, name, 'work')
+        return None
+
+    def recover(self):
+        """
+        Puts jobs left claimed by workers which died back in the queue,
+        returning how many.  Only call this when no worker is running.
+        """
+        n = 0
+        for name in self._list('work'):
+            try:
+                os.rename(os.path.join(self.path, 'work', name),
+                          os.path.join(self.path, 'new', name))
+                n += 1
+            except OSError:
+                pass
+        return n
+
+    def depth(self):
+        return dict((state, len(self._list(state))) for state in ('new', 'work', 'failed'))
+
+    def oldest(self):
+        """
+        Seconds the oldest waiting job has waited, or 0.
+        """
+        waiting = self._list('new') + self._list('work')
+        if not waiting:
+            return 0.0
+        return max(0.0, time.time() - received(min(waiting)))
+
+    # --- worker totals.
+    def record(self, stats):
+        fn = os.path.join(self.path, 'stats', '%d.json' % os.getpid())
+        tmp = fn + '.tmp'
+        json.dump(stats, open(tmp, 'w'))
+        os.rename(tmp, fn)
+
+    def totals(self):
+        out = dict(done = 0, failed = 0, latency_sum = 0.0, latency_max = 0.0,
+                   analysis_sum = 0.0)
+        for name in self._list('stats'):
+            if not name.endswith('.json'):
+                continue
+            try:
+                s = json.load(open(os.path.join(self.path, 'stats', name)))
+            except (IOError, ValueError):
+                continue
+            for k in ('done', 'failed', 'latency_sum', 'analysis_sum'):
+                out[k] += s.get(k, 0)
+            out['latency_max'] = max(out['latency_max'], s.get('latency_max', 0.0))
+        return out
+
+def metrics(spool):
+    """
+    Returns the spool's metrics, as a list of (name, value).
+    """
+    depth = spool.depth()
+    t = spool.totals()
+    done = t['done'] or 1
+    return [
+        ('lha_spool_waiting', depth['new']),
+        ('lha_spool_in_progress', depth['work']),
+        ('lha_spool_failed', depth['failed']),
+        ('lha_spool_oldest_seconds', round(spool.oldest(), 3)),
+        ('lha_ingest_done_total', t['done']),
+        ('lha_ingest_failed_total', t['failed']),
+        ('lha_ingest_latency_seconds_sum', round(t['latency_sum'], 3)),
+        ('lha_ingest_latency_seconds_mean', round(t['latency_sum'] / done, 3)),
+        ('lha_ingest_latency_seconds_max', round(t['latency_max'], 3)),
+        ('lha_ingest_analysis_seconds_mean', round(t['analysis_sum'] / done, 3)),
+    ]
@@ -1,18 +1,52 @@
 
 from django.shortcuts import render_to_response, get_object_or_404
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, Http404
+import json
 import lhpath
 import lighthouse.input
 import localsettings
 import codepresentation
+import codepresentation.bbgraph as bbgraph
 from models import *
+import spool
+import cache
+
+INDEX_UNIT = localsettings.ROOT + '/../dddstest.c.lh'
+
+def _cfg(f):
+    # one function's control flow graph, fetched by cfg.js as it scrolls
+    # into view.  functions go by index: names need not be valid in urls
+    # or element ids (eg. C++ constructors and operators).
+    if f is None:
+        raise Http404
+    return HttpResponse(json.dumps(bbgraph.describe(f), separators = (',', ':')),
+                        mimetype = 'application/json')
+
+def _nth(functions, index):
+    if index < len(functions):
+        return functions[index]
+    return None
 
 def index(req):
-    tu = lighthouse.input.parse(localsettings.ROOT + '/../dddstest.c.lh')
-    lines = codepresentation.format_source(tu)
-    for f in tu.functions:
-        f.cyclomatic_complexity()
-    return render_to_response('index.html', dict(lines = lines))
+    entry = cache.g_cache.for_file(INDEX_UNIT)
+    return render_to_response('index.html', dict(lines = entry.lines, cfg_url = '/cfg/'))
+
+def index_cfg(req, index):
+    return _cfg(_nth(cache.g_cache.for_file(INDEX_UNIT).unit.functions, int(index)))
+
+def unit(req, id):
+    entry = cache.g_cache.for_unit(get_object_or_404(Unit, pk = id))
+    return render_to_response('index.html', dict(lines = entry.lines, cfg_url = '/unit/%s/cfg/' % id))
+
+def unit_cfg(req, id, index):
+    row = get_object_or_404(Unit, pk = id)
+    index = int(index)
+    entry = cache.g_cache.cached_unit(row)
+    if entry is not None:
+        return _cfg(_nth(entry.unit.functions, index))
+    # read no more of the report than the function.
+    u, f = row.function(index)
+    return _cfg(f)
 
 def projects(req):
     resp = HttpResponse()
@@ -27,9 +61,13 @@ def backend(req):
         if x not in req.POST:
             return HttpResponseBadRequest('Missing %s' % x)
     
-    project = Project(name = req.POST['project'])
-    project.save()
-    unit = Unit(raw = req.FILES['xml'].read(), project = project, reporter = req.get_host())
-    unit.save()
-    return HttpResponse('ok')
+    # analysed later, by the ingest workers.
+    name = spool.Spool().put(req.FILES['xml'], req.POST['project'], req.get_host())
+    return HttpResponse('queued %s' % name, status = 202)
+
+def metrics(req):
+    resp = HttpResponse(mimetype = 'text/plain')
+    for name, value in spool.metrics(spool.Spool()) + cache.g_cache.metrics():
+        print >>resp, name, value
+    return resp
     
\ No newline at end of file
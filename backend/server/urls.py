@@ -8,6 +8,10 @@ import localsettings
 urlpatterns = patterns('',
     (r'^m/(?P<path>.*)$', 'django.views.static.serve', dict(document_root = localsettings.ROOT + '/media', show_indexes = 1)),
     (r'^$',     'lha.views.index'),
+    (r'^cfg/(?P<index>\d+)$',     'lha.views.index_cfg'),
+    (r'^unit/(?P<id>\d+)$',     'lha.views.unit'),
+    (r'^unit/(?P<id>\d+)/cfg/(?P<index>\d+)$',     'lha.views.unit_cfg'),
     (r'^projects$',     'lha.views.projects'),
     (r'^backend$',     'lha.views.backend'),
+    (r'^metrics$',     'lha.views.metrics'),
 )
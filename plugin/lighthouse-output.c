@@ -1,6 +1,12 @@
 
 #include "lighthouse-internal.h"
 #include <assert.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+
+/* If set, names the unix socket of a running lh-daemon, which is
+ * sent each unit instead of spawning lh-pipe for it. */
+#define LH_SOCKET_ENV "LH_SOCKET"
 
 static void start(FILE **f, const char *what_for)
 {
@@ -111,11 +117,83 @@ static FILE * lh_spawn_output_prog(void)
   return rc; 
 }
 
+/* Returns NULL, having warned, if there is no daemon to talk to:
+ * the caller runs lh-pipe instead. */
+static FILE * lh_connect_output_sock(const char *path, FILE **reply)
+{
+  struct sockaddr_un addr;
+  int fd;
+  FILE *rc;
+
+  if (strlen(path) >= sizeof(addr.sun_path))
+  {
+    fprintf(stderr, "lighthouse: socket path too long, running lh-pipe instead: %s\n", path);
+    return NULL;
+  }
+
+  fd = socket(AF_UNIX, SOCK_STREAM, 0);
+  if (fd == -1)
+  {
+    perror("lighthouse socket open failed, running lh-pipe instead");
+    return NULL;
+  }
+
+  memset(&addr, 0, sizeof(addr));
+  addr.sun_family = AF_UNIX;
+  memcpy(addr.sun_path, path, strlen(path));
+
+  if (-1 == connect(fd, (struct sockaddr *) &addr, sizeof(addr)))
+  {
+    /* stale socket, or the daemon is restarting. */
+    perror("lighthouse connect to lh-daemon failed, running lh-pipe instead");
+    close(fd);
+    return NULL;
+  }
+
+  /* Separate streams for each direction; stdio can't switch
+   * a socket between reading and writing. */
+  rc = fdopen(fd, "w");
+  *reply = fdopen(dup(fd), "r");
+  if (rc == NULL || *reply == NULL)
+  {
+    perror("lighthouse socket fdopen failed");
+    exit(EXIT_FAILURE);
+  }
+
+  return rc;
+}
+
+/* Copies the daemon's diagnostics to stderr, and returns the
+ * exit status which follows them after a NUL. */
+static int lh_daemon_reply(FILE *f, FILE *reply)
+{
+  int c, status;
+
+  fflush(f);
+  if (-1 == shutdown(fileno(f), SHUT_WR))
+  {
+    perror("lighthouse socket shutdown failed");
+    exit(EXIT_FAILURE);
+  }
+
+  while ((c = fgetc(reply)) != EOF && c != '\0')
+    fputc(c, stderr);
+
+  if (c == EOF || fscanf(reply, "%d", &status) != 1)
+  {
+    fprintf(stderr, "lighthouse: lh-daemon closed the connection without a status\n");
+    return EXIT_FAILURE;
+  }
+
+  return status;
+}
+
 void lh_output_finish(lh_output *lho)
 {
   char mif[FILENAME_MAX] = { 0 };
   int child_rc;
-  FILE *f, *src;
+  FILE *f, *src, *reply = NULL;
+  const char *sock = getenv(LH_SOCKET_ENV);
 
   assert(lho);
   assert(lho->types);
@@ -127,7 +205,11 @@ void lh_output_finish(lh_output *lho)
   assert(strlen(main_input_filename) < FILENAME_MAX);
   memcpy(mif, main_input_filename, strlen(main_input_filename));
 
-  f = lh_spawn_output_prog();
+  f = NULL;
+  if (sock && *sock)
+    f = lh_connect_output_sock(sock, &reply);
+  if (!f)
+    f = lh_spawn_output_prog();
   if (!f)
   {
     perror("opening output file");
@@ -160,14 +242,23 @@ void lh_output_finish(lh_output *lho)
 
   fclose(lho->types);
   fclose(lho->functions);
-  fclose(f);
-  fclose(src);
 
-  wait(&child_rc);
+  if (reply)
+  {
+    child_rc = lh_daemon_reply(f, reply);
+    fclose(reply);
+    fclose(f);
+  } else {
+    fclose(f);
+    wait(&child_rc);
+    child_rc = WEXITSTATUS(child_rc);
+  }
+
+  fclose(src);
 
-  if (WEXITSTATUS(child_rc))
+  if (child_rc)
   {
-    printf("lighthouse-plugin: child exited non-zero (%d)\n", WEXITSTATUS(child_rc));
+    printf("lighthouse-plugin: child exited non-zero (%d)\n", child_rc);
     exit(EXIT_FAILURE);
   }
 }
@@ -101,3 +101,170 @@ function unhighlightArrows(fn, bb)
 {
   setArrows(fn, bb, edgeOpacity, edgeColour, edgeColour);
 }
+
+/*
+ * The graphs are not in the page: each is fetched as JSON from cfgBase +
+ * fn when its code scrolls into view, and drawn when first shown.  'fn'
+ * is the function's index in the unit, which also names its elements:
+ * function names need not be valid in urls or ids.  Events are handled
+ * once, on the whole table, so the page has no script per function or
+ * block.
+ */
+var cfgBase = null;
+var cfgGraphs = {};  // fn -> 'loading', or the graph
+var cfgDrawn = {};
+var cfgTimer = null;
+
+function cfgRender(fn, g)
+{
+  var html = ['<table class="blockgraph"><tr><td>'];
+  for (var i = 0; i < g.blocks.length; i++)
+  {
+    var id = g.blocks[i][0], lines = g.blocks[i][1];
+    html.push('<div id="block_' + fn + '_' + id + '" class="basicblock">');
+    for (var j = 0; j < lines.length; j++)
+    {
+      var line = lines[j][0];
+      html.push('<div id="lineblock_' + fn + '_' + id + '_' + line +
+                '" class="lineblock lineblock_' + fn + '_' + line +
+                '" title="Line ' + line + '"><pre>' +
+                lines[j][1].join('<br/>') + '</pre></div>');
+    }
+    html.push('</div>');
+  }
+  html.push('</td><td><div id="blockgraph_' + fn + '" class="blockgraph"></div></td></tr></table>');
+  $('#blocks_' + fn).html(html.join(''));
+}
+
+function cfgDraw(fn)
+{
+  var g = cfgGraphs[fn];
+  if (cfgDrawn[fn] || typeof g != 'object')
+    return;
+  cfgDrawn[fn] = true;
+  
+  var d = document.getElementById('blockgraph_' + fn);
+  var h = document.getElementById('blocks_' + fn);
+  var r = Raphael(d, cfgGraphWidth, h.getSize().y);
+  for (var i = 0; i < g.arrows.length; i++)
+  {
+    var a = g.arrows[i];
+    cfgArrow(r, fn, a[0], a[1], a[2], a[3]);
+  }
+}
+
+function cfgLoad(fn)
+{
+  if (cfgGraphs[fn] != undefined)
+    return;
+  cfgGraphs[fn] = 'loading';
+  $.getJSON(cfgBase + fn, function(g) {
+    cfgGraphs[fn] = g;
+    cfgRender(fn, g);
+    if ($('#blocks_' + fn).is(':visible'))
+      cfgDraw(fn);
+  });
+}
+
+function cfgLoadVisible()
+{
+  cfgTimer = null;
+  var top = $(window).scrollTop();
+  var bottom = top + $(window).height();
+  $('#unitcode div.cfg').each(function() {
+    var fn = this.id.substring('blocks_'.length);
+    if (cfgGraphs[fn] != undefined)
+      return;
+    var td = $(this).parent();
+    var y = td.offset().top;
+    if (y < bottom && y + td.height() > top)
+      cfgLoad(fn);
+  });
+}
+
+function cfgScrolled()
+{
+  if (cfgTimer == null)
+    cfgTimer = setTimeout(cfgLoadVisible, 100);
+}
+
+function cfgToggle(fn)
+{
+  var v = $('#blocks_' + fn);
+  cfgLoad(fn);
+  v.toggle('slow', function() {
+    if (v.is(':visible'))
+      cfgDraw(fn);
+  });
+}
+
+function cfgInfo(a)
+{
+  if (a.btOn == undefined)
+  {
+    $(a).bt({
+      contentSelector: "$('#info_" + a.id.substring('do_showinfo_'.length) + "')",
+      positions: ['bottom'],
+      trigger: 'none'
+    });
+  }
+  if ($(a).hasClass('bt-active'))
+    a.btOff();
+  else
+    a.btOn();
+}
+
+// whether the pointer moved to or from outside 'e' (mouseover and
+// mouseout also fire moving between its children).
+function cfgCrossed(ev, e)
+{
+  return $(ev.relatedTarget).closest(e.tagName + '.' + e.className.split(' ')[0])[0] != e;
+}
+
+function cfgHover(ev, on)
+{
+  var t = $(ev.target);
+  var lb = t.closest('div.lineblock')[0];
+  if (lb && cfgCrossed(ev, lb))
+  {
+    var line = lb.id.split('_').pop();
+    $('#lineno_' + line).toggleClass('lineno_hilight', on);
+    $(lb).toggleClass('lineblock_hilight', on);
+  }
+  var bb = t.closest('div.basicblock')[0];
+  if (bb && cfgCrossed(ev, bb))
+  {
+    var fn = t.closest('div.cfg')[0].id.substring('blocks_'.length);
+    var id = bb.id.split('_').pop();
+    if (on)
+      highlightArrows(fn, id);
+    else
+      unhighlightArrows(fn, id);
+  }
+}
+
+$(function() {
+  var code = $('#unitcode');
+  if (!code.length || cfgBase == null)
+    return;
+  
+  code.bind('click', function(ev) {
+    var t = $(ev.target);
+    var a = t.closest('a.showblocks')[0];
+    if (a)
+    {
+      cfgToggle(a.id.substring('do_showblocks_'.length));
+      return false;
+    }
+    a = t.closest('a.showinfo')[0];
+    if (a)
+    {
+      cfgInfo(a);
+      return false;
+    }
+  });
+  code.bind('mouseover', function(ev) { cfgHover(ev, true); });
+  code.bind('mouseout', function(ev) { cfgHover(ev, false); });
+  $(window).bind('scroll resize', cfgScrolled);
+  cfgLoadVisible();
+});